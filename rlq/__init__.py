@@ -1,4 +1,30 @@
-import os.path as _path
-__VERSION__ = open(_path.join(_path.dirname(__file__), 'VERSION'), 'r').read().strip()
+# The submodules, and through them NumPy and Arelle, are only imported when first used
+# so that importing rlq stays cheap for short-lived processes and pool workers.
+import importlib as _importlib
 
-from .utils import get_query_executor
+_SUBMODULES = frozenset(['aio', 'cancel', 'errors', 'evaluators', 'executor', 'expr', 'fact_set', 'instrument',
+                         'materialized', 'memory', 'pipeline', 'pool', 'rl_utils', 'serialize', 'store', 'taxonomy',
+                         'text_index', 'utils', 'value_index', 'workers'])
+
+
+def _read_version():
+    import os.path
+    with open(os.path.join(os.path.dirname(__file__), 'VERSION'), 'r') as f:
+        return f.read().strip()
+
+
+def __getattr__(name):
+    if name == '__VERSION__':
+        value = _read_version()
+    elif name == 'get_query_executor':
+        value = _importlib.import_module('rlq.utils').get_query_executor
+    elif name in _SUBMODULES:
+        value = _importlib.import_module('rlq.' + name)
+    else:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | _SUBMODULES | {'__VERSION__', 'get_query_executor'})
@@ -0,0 +1,82 @@
+"""Asyncio entry points for loading and querying XBRL instances.
+
+Loading and querying are blocking, CPU-heavy calls, so they are handed to a
+concurrent.futures executor (the event loop's default thread pool unless one is given)
+and awaited from the event loop.
+
+Cancelling the awaiting task cancels work that has not started yet. Work that is
+already running in a worker cannot be interrupted: it runs to completion and its
+result is discarded. To bound the time a query can hold a worker, give it a timeout
+(see rlq.cancel).
+"""
+import asyncio
+import functools
+import time
+import weakref
+
+from rlq import serialize
+from rlq.cancel import Deadline
+from rlq.utils import get_query_executor
+
+
+def _query_file(file_path, query_spec_str, expires=None):
+    # Runs in the worker, which may be another process, so the query spec is
+    # passed as a string and parsed (and cached) there, and the deadline as a
+    # time.time() timestamp since monotonic clocks are not shared between processes.
+    deadline = Deadline.after(expires - time.time()) if expires is not None else None
+    executor = get_query_executor(file_path)
+    try:
+        return executor.query(serialize.loads(query_spec_str), deadline=deadline)
+    finally:
+        executor.evaluator.close()
+
+
+class AsyncLoader(object):
+    """Load XBRL instances from coroutines with a bound on concurrent loads.
+
+    executor is the concurrent.futures executor the loads run in. load() returns a
+    QExecutor holding the Arelle model, so it needs a thread executor; query_file() only
+    returns the query results and also works with a process executor.
+    """
+
+    def __init__(self, executor=None, max_concurrent_loads=4):
+        self.executor = executor
+        self.max_concurrent_loads = max_concurrent_loads
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self, loop):
+        # Semaphores belong to an event loop, so keep one per loop
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrent_loads)
+        return semaphore
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        async with self._semaphore(loop):
+            return await loop.run_in_executor(self.executor, functools.partial(fn, *args))
+
+    async def load(self, file_path):
+        return await self._run(get_query_executor, file_path)
+
+    async def query_file(self, file_path, query_spec, timeout=None):
+        expires = time.time() + timeout if timeout is not None else None
+        return await self._run(_query_file, file_path, serialize.dumps(query_spec), expires)
+
+
+_default_loader = AsyncLoader()
+
+
+async def load_async(file_path, loader: AsyncLoader=None):
+    """Load an XBRL instance without blocking the event loop and return its QExecutor."""
+    return await (loader or _default_loader).load(file_path)
+
+
+async def query_file_async(file_path, query_spec, loader: AsyncLoader=None, timeout=None):
+    """Load an XBRL instance and run a query on it in the loader's executor.
+
+    timeout is in seconds from the call, including the time spent waiting for the
+    executor and loading the instance. The query raises rlq.errors.QueryTimeout when
+    it runs past it.
+    """
+    return await (loader or _default_loader).query_file(file_path, query_spec, timeout)
@@ -0,0 +1,90 @@
+"""Cooperative cancellation and deadlines for queries.
+
+Pass a Deadline (or a number of seconds) and/or a CancellationToken to QExecutor.query()
+to stop the query with QueryTimeout or QueryCancelled:
+
+    token = CancellationToken()
+    # token.cancel() from another thread stops the query
+    try:
+        executor.query(query_spec, deadline=2.5, cancel_token=token)
+    except QueryAborted as e:
+        print(e.stats)
+
+Both are checked at the start of each stage of the query and periodically inside the
+loops of the stages (see QExecutor), so a query stops within a few fact sets' worth of
+work after its deadline or cancellation, not instantly. Work done outside those loops,
+e.g. an evaluator building a text index, runs to completion first.
+"""
+import threading
+import time
+
+from rlq.errors import QueryCancelled, QueryTimeout
+
+
+class Deadline(object):
+    """A point in time, on the time.monotonic() clock, after which queries are stopped.
+
+    One deadline can be shared by several queries, e.g. all the queries of a request.
+    timeout is the number of seconds it was set from, if any, for reporting.
+    """
+
+    def __init__(self, at, timeout=None):
+        self.at = at
+        self.timeout = timeout
+
+    @classmethod
+    def after(cls, seconds):
+        return cls(time.monotonic() + seconds, timeout=seconds)
+
+    @property
+    def remaining(self):
+        return max(self.at - time.monotonic(), 0)
+
+    @property
+    def expired(self):
+        return time.monotonic() > self.at
+
+    def start(self, stats):
+        self.check(stats)
+
+    def stage(self, name, stats):
+        self.check(stats)
+
+    def check(self, stats):
+        overrun = time.monotonic() - self.at
+        if overrun > 0:
+            raise QueryTimeout('Query passed its deadline by {:.3f}s in stage {}'.format(overrun, stats.get('stage')),
+                               stats, timeout=self.timeout, overrun=overrun)
+
+    def stop(self, stats):
+        pass
+
+
+class CancellationToken(object):
+    """Lets one thread stop the queries that are running with the token in other threads.
+
+    Cancelling is permanent: queries started with a cancelled token stop right away.
+    """
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def start(self, stats):
+        self.check(stats)
+
+    def stage(self, name, stats):
+        self.check(stats)
+
+    def check(self, stats):
+        if self._cancelled.is_set():
+            raise QueryCancelled('Query was cancelled in stage {}'.format(stats.get('stage')), stats)
+
+    def stop(self, stats):
+        pass
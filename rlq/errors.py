@@ -0,0 +1,32 @@
+class QueryAborted(RuntimeError):
+    """A query was stopped before it completed.
+
+    stats holds the progress made so far: the stage the query was in and the number of
+    facts, fact sets, groups and output rows produced by the stages that completed.
+    """
+
+    def __init__(self, message, stats=None):
+        super(QueryAborted, self).__init__(message)
+        self.stats = dict(stats or {})
+
+
+class MemoryLimitExceeded(QueryAborted):
+    def __init__(self, message, stats=None, limit=None, used=None):
+        super(MemoryLimitExceeded, self).__init__(message, stats)
+        self.limit = limit
+        self.used = used
+
+
+class QueryTimeout(QueryAborted):
+    """timeout is the number of seconds the query was given, if known, and overrun the
+    number of seconds by which it passed its deadline before it was stopped.
+    """
+
+    def __init__(self, message, stats=None, timeout=None, overrun=None):
+        super(QueryTimeout, self).__init__(message, stats)
+        self.timeout = timeout
+        self.overrun = overrun
+
+
+class QueryCancelled(QueryAborted):
+    pass
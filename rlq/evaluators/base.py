@@ -77,3 +77,43 @@ class ExprEvaluator(abc.ABC):
     @abc.abstractmethod
     def get_context_hash_no_period_type(self, fact):
         pass
+
+    def get_entity_identifier(self, fact):
+        """Return the (scheme, identifier) of the entity of a fact.
+
+        Only needed by rlq.store, so evaluators that are not added to an EntityFactStore
+        need not implement it.
+        """
+        raise NotImplementedError('{} does not provide entity identifiers'.format(type(self).__name__))
+
+    def search_text(self, concept_name, op_name, pattern):
+        """Return the facts of a concept whose value matches a text predicate.
+
+        op_name is one of contains, icontains, regex or iregex. Evaluators without a text
+        index return None and the predicate is evaluated on each fact set instead.
+        """
+        return None
+
+    def search_value(self, concept_name, op_name, value):
+        """Return the facts of a concept whose value satisfies a comparison with value.
+
+        op_name is one of eq, ne, gt, ge, lt, le, in_ or nin. Evaluators without a value
+        index, or whose index cannot answer the comparison, return None.
+        """
+        return None
+
+    def search_fy(self, op_name, year):
+        """Return all the facts whose FY satisfies a comparison with year, or None."""
+        return None
+
+    def warm(self):
+        """Build any lazily created indexes upfront, e.g. before sharing the evaluator between threads."""
+        pass
+
+    def estimated_size(self):
+        """Approximate number of bytes held by the evaluator and its underlying model."""
+        return 0
+
+    def close(self):
+        """Release the underlying model. The evaluator cannot be used afterwards."""
+        pass
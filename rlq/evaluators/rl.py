@@ -1,4 +1,5 @@
 import collections
+import threading
 from datetime import timedelta
 from typing import Optional
 
@@ -6,9 +7,19 @@ from arelle.ModelDtsObject import ModelConcept
 from arelle.ModelInstanceObject import ModelDimensionValue, ModelContext
 from arelle.ModelValue import qname, QName
 from arelle.ModelXbrl import ModelXbrl
+from arelle import XbrlConst
 
 from rlq.evaluators.base import ExprEvaluator
-from rlq.rl_utils import parsed_value, load_xbrl_model
+from rlq.rl_utils import (build_taxonomy, get_entry_point, load_dimension_defaults, load_xbrl_model, parsed_value,
+                          prune_facts)
+from rlq.taxonomy import split_clark_name
+from rlq.text_index import TextIndex
+from rlq.value_index import ValueIndex
+
+
+# Rough average memory footprint of an Arelle model object (fact, context, concept,
+# label, ...) including its lxml element, used to estimate the size of a loaded model
+MODEL_OBJECT_BYTES = 1200
 
 
 def get_end_date(context: ModelContext):
@@ -25,31 +36,116 @@ def get_context_hash_no_period_type(context: ModelContext):
 
 
 class RLExprEvaluator(ExprEvaluator):
-    @classmethod
-    def load(cls, file_path):
-        model = load_xbrl_model(file_path)
-        return cls(model)
+    """ExprEvaluator over a loaded Arelle model.
 
-    def __init__(self, arelle_model: ModelXbrl):
+    The evaluator only reads from the model once it is loaded, so a single instance can
+    be queried from many threads at the same time. Its lazily built indexes (and the
+    lazily built indexes of the Arelle model that it reads) are created once under a lock
+    and only published when complete. Call warm() to build all of them upfront instead of
+    on first use.
+
+    taxonomy is an optional rlq.taxonomy.Taxonomy of the instance, from which concept
+    kinds, labels and dimension defaults are read instead of from the model.
+    """
+    @classmethod
+    def load(cls, file_path, concepts=None, catalog=None, taxonomy_version='', **kwargs):
+        """Load an instance, keeping only the facts of the given concept names if any.
+
+        catalog is an optional rlq.taxonomy.TaxonomyCatalog. The instance's taxonomy is
+        read from it, or added to it from this instance if it is not there yet.
+        """
+        model = load_xbrl_model(file_path, dimension_defaults=catalog is None)
+        if catalog is not None:
+            entry_point = get_entry_point(model)
+            taxonomy = catalog.get(entry_point, taxonomy_version)
+            if taxonomy is None:
+                load_dimension_defaults(model)
+                taxonomy = catalog.add(build_taxonomy(model, entry_point, taxonomy_version))
+            kwargs['taxonomy'] = taxonomy
+        evaluator = cls(model, **kwargs)
+        if concepts is not None:
+            qnames = set()
+            for name in concepts:
+                try:
+                    qn = evaluator.qn(name)
+                except IndexError:
+                    # Local name of a concept that is not in the taxonomy
+                    continue
+                except ValueError:
+                    # Local name of several concepts: keep the facts of all of them, querying
+                    # the name raises the same error as without pruning
+                    local_name_to_qname = evaluator._once('_local_name_to_qname',
+                                                          evaluator._build_local_name_to_qname)
+                    qnames.update(local_name_to_qname[name])
+                    continue
+                if qn is not None:
+                    qnames.add(qn)
+            # The FYs, from which FY.CURR and FY.PREV are resolved, are those of all the
+            # contexts of the instance, including the ones that only pruned facts use
+            evaluator.all_years
+            prune_facts(model, qnames)
+        return evaluator
+
+    def __init__(self, arelle_model: ModelXbrl, text_index=True, value_index=True, taxonomy=None):
         self.model = arelle_model
+        self.taxonomy = taxonomy
+        self._concept_kinds = {}
+        self.text_index = text_index
+        self._text_indexes = {}
+        self.value_index = value_index
+        self._value_indexes = {}
+        self._lock = threading.RLock()
+
+    def _once(self, attr, build):
+        try:
+            return getattr(self, attr)
+        except AttributeError:
+            with self._lock:
+                try:
+                    return getattr(self, attr)
+                except AttributeError:
+                    value = build()
+                    setattr(self, attr, value)
+                    return value
+
+    def warm(self):
+        self._once('_facts_by_qname', self._build_facts_by_qname)
+        self._once('_fys', self._build_all_years)
+        self._once('_namespaces', lambda: self.model.prefixedNamespaces)
+        self._once('_local_name_to_qname', self._build_local_name_to_qname)
+        self._once('_dim_defaults', self._build_dim_defaults)
+        # Also with a taxonomy, which only has the standard role labels of its concepts
+        with self._lock:
+            self.model.relationshipSet(XbrlConst.conceptLabel)
+
+    def estimated_size(self):
+        return sum(1 for obj in self.model.modelObjects if obj is not None) * MODEL_OBJECT_BYTES
+
+    def close(self):
+        self.model.close()
+
+    def _build_facts_by_qname(self):
+        # Arelle builds factsByQname on first access into a defaultdict that
+        # is visible before it is complete, so it is only touched under the lock.
+        return self.model.factsByQname
 
     def get_facts(self, concept_name=None):
         if concept_name is not None:
-            return self.model.factsByQname[self.qn(concept_name)]
+            facts_by_qname = self._once('_facts_by_qname', self._build_facts_by_qname)
+            return facts_by_qname.get(self.qn(concept_name), set())
         return self.model.factsInInstance
 
+    def _build_all_years(self):
+        fys = set()
+        for context in self.model.contexts.values():  # type: ModelContext
+            fy = get_fy(context)
+            if fy is not None:
+                fys.add(fy)
+        return sorted(fys, reverse=True)
+
     @property
     def all_years(self):
-        try:
-            return self._fys
-        except AttributeError:
-            fys = set()
-            for context in self.model.contexts.values():  # type: ModelContext
-                fy = get_fy(context)
-                if fy is not None:
-                    fys.add(fy)
-            self._fys = sorted(fys, reverse=True)
-            return self._fys
+        return self._once('_fys', self._build_all_years)
 
     def get_year(self, year: int):
         if year <= 0:
@@ -65,24 +161,22 @@ class RLExprEvaluator(ExprEvaluator):
             return qname(name)
         # else if the name contains a namespace prefix
         elif ':' in name:
-            try:
-                namespaces = self._namespaces
-            except AttributeError:
-                namespaces = self._namespaces = self.model.prefixedNamespaces
+            namespaces = self._once('_namespaces', lambda: self.model.prefixedNamespaces)
             return qname(name, namespaces)
         # else it is a local name
         else:
-            try:
-                local_name_to_qname = self._local_name_to_qname
-            except AttributeError:
-                local_name_to_qname = self._local_name_to_qname = collections.defaultdict(list)
-                for qn_ in self.model.qnameConcepts:  # type: QName
-                    local_name_to_qname[qn_.localName].append(qn_)
-            qnames = local_name_to_qname[name]
+            local_name_to_qname = self._once('_local_name_to_qname', self._build_local_name_to_qname)
+            qnames = local_name_to_qname.get(name, [])
             if len(qnames) > 1:
                 raise ValueError('Multiple QNames for local name {}: {}'.format(name, qnames))
             return qnames[0]
 
+    def _build_local_name_to_qname(self):
+        local_name_to_qname = collections.defaultdict(list)
+        for qn_ in self.model.qnameConcepts:  # type: QName
+            local_name_to_qname[qn_.localName].append(qn_)
+        return dict(local_name_to_qname)
+
     def get_concept(self, fact, name) -> ModelConcept:
         if fact is not None:
             return fact.concept
@@ -97,14 +191,90 @@ class RLExprEvaluator(ExprEvaluator):
 
     def get_concept_label(self, fact, name, label_role=None) -> str:
         concept = self.get_concept(fact, name)
-        return concept.label(label_role, strip=True) if concept is not None else None
+        return self._label(concept, label_role) if concept is not None else None
+
+    def _label(self, concept, label_role):
+        if self.taxonomy is not None:
+            label = self.taxonomy.label(concept.qname.clarkNotation, label_role)
+            if label is not None:
+                return label
+        return concept.label(label_role, strip=True)
+
+    def _parsed_value(self, fact):
+        if self.taxonomy is None or fact is None:
+            return parsed_value(fact)
+        qn = fact.qname
+        try:
+            kind = self._concept_kinds[qn]
+        except KeyError:
+            # Concepts that are not in the taxonomy (None) fall back to the model
+            kind = self._concept_kinds[qn] = self.taxonomy.kinds.get(qn.clarkNotation)
+        return parsed_value(fact, kind)
 
     def get_fact_value(self, fact, default):
-        value = parsed_value(fact)
+        value = self._parsed_value(fact)
         return value if value is not None else default
 
     get_concept_value = get_fact_value
 
+    def search_text(self, concept_name, op_name, pattern):
+        if not self.text_index:
+            return None
+        qn = self.qn(concept_name)
+        if qn is None:
+            # A name with an unknown prefix, which no fact has
+            return frozenset()
+        index = self._text_indexes.get(qn)
+        if index is None:
+            with self._lock:
+                index = self._text_indexes.get(qn)
+                if index is None:
+                    # Index the parsed values so that text blocks are normalized only once
+                    fact_values = [(f, self._parsed_value(f)) for f in self.get_facts(qn)]
+                    if all(isinstance(v, str) for _, v in fact_values if v is not None):
+                        index = TextIndex((f, v) for f, v in fact_values if v is not None)
+                    else:
+                        index = False
+                    self._text_indexes[qn] = index
+        return index.search(op_name, pattern) if index else None
+
+    def search_value(self, concept_name, op_name, value):
+        if not self.value_index:
+            return None
+        qn = self.qn(concept_name)
+        if qn is None:
+            # A name with an unknown prefix, which no fact has
+            return frozenset()
+        index = self._value_indexes.get(qn)
+        if index is None:
+            with self._lock:
+                index = self._value_indexes.get(qn)
+                if index is None:
+                    index = ValueIndex((f, self._parsed_value(f)) for f in self.get_facts(qn))
+                    self._value_indexes[qn] = index
+        return index.search(op_name, value)
+
+    def _build_fy_index(self):
+        return ValueIndex((f, get_fy(f.context)) for f in self.model.factsInInstance if f.context is not None)
+
+    def search_fy(self, op_name, year):
+        if not self.value_index:
+            return None
+        return self._once('_fy_index', self._build_fy_index).search(op_name, year)
+
+    def _build_dim_defaults(self):
+        if self.taxonomy is None:
+            return self.model.qnameDimensionDefaults
+        dim_defaults = {}
+        for axis, member in self.taxonomy.dim_defaults.items():
+            axis_qn = qname(split_clark_name(axis)[0], self.taxonomy.names[axis])
+            dim_defaults[axis_qn] = qname(split_clark_name(member)[0], self.taxonomy.names[member])
+        return dim_defaults
+
+    def get_dim_default(self, axis_name):
+        """QName of the default member of an axis, or None."""
+        return self._once('_dim_defaults', self._build_dim_defaults).get(self.qn(axis_name))
+
     def get_provided_dim_value(self, fact, axis_name) -> Optional[ModelDimensionValue]:
         if fact is None or fact.context is None:
             return None
@@ -116,7 +286,7 @@ class RLExprEvaluator(ExprEvaluator):
         if dim_value is not None:
             return dim_value.member if dim_value.isExplicit else dim_value.typedMember
         elif include_defaults:
-            member_qn = self.model.qnameDimensionDefaults.get(self.qn(axis_name))
+            member_qn = self.get_dim_default(axis_name)
             if member_qn is not None:
                 return self.model.qnameConcepts[member_qn]
         return None
@@ -126,7 +296,7 @@ class RLExprEvaluator(ExprEvaluator):
         if dim_value is not None:
             return str(dim_value.member.qname) if dim_value.isExplicit else None
         elif include_defaults:
-            member_qn = self.model.qnameDimensionDefaults.get(self.qn(axis_name))
+            member_qn = self.get_dim_default(axis_name)
             if member_qn is not None:
                 return str(member_qn)
         return None
@@ -134,13 +304,13 @@ class RLExprEvaluator(ExprEvaluator):
     def get_dim_member_label(self, fact, axis_name, include_defaults=True, label_role=None):
         dim_value = self.get_provided_dim_value(fact, axis_name)
         if dim_value is not None:
-            return (dim_value.member.label(label_role, strip=True) if dim_value.isExplicit
+            return (self._label(dim_value.member, label_role) if dim_value.isExplicit
                     else dim_value.typedMember.textValue.strip())
         elif include_defaults:
-            member_qn = self.model.qnameDimensionDefaults.get(self.qn(axis_name))
+            member_qn = self.get_dim_default(axis_name)
             if member_qn is not None:
                 member = self.model.qnameConcepts[member_qn]
-                return member.label(label_role, strip=True)
+                return self._label(member, label_role)
         return None
 
     def get_dim_member_value(self, fact, axis_name, include_defaults=True, label_role=None):
@@ -149,7 +319,7 @@ class RLExprEvaluator(ExprEvaluator):
             return (str(dim_value.member.qname) if dim_value.isExplicit
                     else dim_value.typedMember.textValue.strip())
         elif include_defaults:
-            member_qn = self.model.qnameDimensionDefaults.get(self.qn(axis_name))
+            member_qn = self.get_dim_default(axis_name)
             if member_qn is not None:
                 return str(member_qn)
         return None
@@ -208,3 +378,9 @@ class RLExprEvaluator(ExprEvaluator):
         if fact is None or fact.context is None:
             return hash(None)
         return get_context_hash_no_period_type(fact.context)
+
+    def get_entity_identifier(self, fact):
+        if fact is None or fact.context is None:
+            return None
+        # (scheme, identifier), which is what entityIdentifierHash hashes
+        return fact.context.entityIdentifier
@@ -1,14 +1,30 @@
+import asyncio
 import collections
+import collections.abc
+import copy
+import functools
+import heapq
 import warnings
 
+from rlq.cancel import CancellationToken, Deadline
 from rlq.evaluators.base import ExprEvaluator
 from rlq.expr import properties as p
+from rlq.expr import tree
+from rlq.expr import vectorized
+from rlq.expr.aggregate import Aggregate
+from rlq.expr.base import BaseExpr, BinaryExpr, Constant, Literal
+from rlq.expr.distinct import Distinct
+from rlq.expr.order import Asc, Order, _Reversed
+from rlq.expr.window import Window
+from rlq.expr.year import Year
 from rlq.fact_set import FactSet
+from rlq.text_index import TEXT_OPS
+from rlq.value_index import VALUE_OPS
 
 
 def _get_select_exprs(query_spec):
     select = query_spec['select']
-    if isinstance(select, collections.Mapping):
+    if isinstance(select, collections.abc.Mapping):
         header_exprs, select_exprs = map(list, zip(*select.items()))
     else:
         headers = list(query_spec.get('headers', []))
@@ -46,9 +62,313 @@ def _get_where_exprs(query_spec):
     return where_exprs
 
 
+def get_concept_names(query_spec):
+    """Names of all the concepts referred to by a query spec."""
+    _, select_exprs = _get_select_exprs(query_spec)
+    exprs = list(select_exprs)
+    concept_names = set()
+    for key in ('where', 'context_groupby', 'groupby', 'rollup', 'having', 'order_by', 'pivot_values'):
+        exprs.extend(query_spec.get(key, []))
+    for grouping_set in query_spec.get('grouping_sets', []):
+        exprs.extend(grouping_set)
+    join = query_spec.get('join')
+    if join is not None:
+        for side_spec in (join['left'], join['right']):
+            concept_names |= set(side_spec.get('concepts', []))
+            exprs.extend(side_spec.get('where', []))
+            exprs.extend(side_spec.get('context_groupby', []))
+        for key_spec in join.get('on', []):
+            exprs.extend(key_spec if isinstance(key_spec, (tuple, list)) else [key_spec])
+    if query_spec.get('pivot') is not None:
+        exprs.append(query_spec['pivot'])
+    for expr in exprs:
+        concept_names |= expr.concept_names
+    return concept_names
+
+
+def get_catalog_concept_names(query_specs):
+    """Union of the concept names of a catalog of query specs.
+
+    Returns None if any of the queries does not name a concept, since such a query
+    reads all the facts of an instance.
+    """
+    concept_names = set()
+    for query_spec in query_specs:
+        query_concept_names = get_concept_names(query_spec)
+        if not query_concept_names:
+            return None
+        concept_names |= query_concept_names
+    return concept_names
+
+
+def _get_order_by_exprs(query_spec):
+    return [e if isinstance(e, Order) else Asc(e) for e in query_spec.get('order_by', [])]
+
+
+def _get_grouping_sets(query_spec):
+    # Expression lists of the grouping sets of a query, in addition to its groupby
+    # expressions, or None. A rollup of (a, b) has the grouping sets (a, b), (a) and ().
+    grouping_sets = query_spec.get('grouping_sets')
+    rollup = query_spec.get('rollup')
+    if rollup is not None:
+        if grouping_sets is not None:
+            raise ValueError('grouping_sets and rollup cannot be combined')
+        rollup = list(rollup)
+        return [rollup[:i] for i in range(len(rollup), -1, -1)]
+    if grouping_sets is not None:
+        grouping_sets = [list(exprs) for exprs in grouping_sets]
+        if not grouping_sets:
+            raise ValueError('grouping_sets cannot be empty')
+    return grouping_sets
+
+
+class _JoinSide(object):
+    # One of the two sub-selections of a join clause
+    def __init__(self, side_spec, key_exprs):
+        self.concept_names = set(side_spec.get('concepts', []))
+        self.ctx_groupby_exprs = list(side_spec.get('context_groupby', [p.ContextID()]))
+        self.where_exprs = _get_where_exprs(side_spec)
+        self.key_exprs = key_exprs
+        for expr in self.where_exprs:
+            self.concept_names |= expr.concept_names
+
+
+def _get_join(query_spec):
+    # The sub-selections of the join clause of a query and its join type, or None
+    join = query_spec.get('join')
+    if join is None:
+        return None
+    if 'context_groupby' in query_spec:
+        raise ValueError('context_groupby cannot be combined with join, set it in the left and right '
+                         'sub-selections instead')
+    how = join.get('how', 'inner')
+    if how not in ('inner', 'left'):
+        raise ValueError('Unsupported join type {}'.format(how))
+    left_key_exprs = []
+    right_key_exprs = []
+    for key_spec in join.get('on', []):
+        # Either an expression evaluated on both sides or a (left, right) pair of expressions
+        left_key_expr, right_key_expr = key_spec if isinstance(key_spec, (tuple, list)) else (key_spec, key_spec)
+        left_key_exprs.append(left_key_expr)
+        right_key_exprs.append(right_key_expr)
+    if not left_key_exprs:
+        raise ValueError('The on clause of a join cannot be empty')
+    left = _JoinSide(join['left'], left_key_exprs)
+    right = _JoinSide(join['right'], right_key_exprs)
+    for name, side in (('left', left), ('right', right)):
+        if not side.concept_names:
+            raise ValueError('The {} sub-selection of a join must list its concepts'.format(name))
+        exprs = side.where_exprs + side.ctx_groupby_exprs + side.key_exprs
+        if any(isinstance(e, Window) for expr in exprs for e in tree.walk(expr)):
+            raise ValueError('Window expressions cannot be used in a join clause')
+    shared_concept_names = left.concept_names & right.concept_names
+    if shared_concept_names:
+        raise ValueError('The left and right sub-selections of a join cannot share concepts: {}'.format(
+            ', '.join(sorted(shared_concept_names))))
+    return left, right, how
+
+
+def _index_grouping_sets(groupby_exprs, grouping_sets):
+    # The distinct grouping expressions of all the grouping sets, and each grouping set
+    # as the indexes of its expressions among them
+    grouping_exprs = []
+    expr_indexes = {}
+    grouping_set_indexes = []
+    for exprs in grouping_sets:
+        indexes = []
+        for expr in groupby_exprs + exprs:
+            expr_key = tree.key(expr)
+            if expr_key is None:
+                expr_key = id(expr)
+            if expr_key not in expr_indexes:
+                expr_indexes[expr_key] = len(grouping_exprs)
+                grouping_exprs.append(expr)
+            indexes.append(expr_indexes[expr_key])
+        grouping_set_indexes.append(tuple(indexes))
+    return grouping_exprs, grouping_set_indexes
+
+
+def _by_grouping_set(expr, grouping_exprs, grouping_set_indexes):
+    # expr evaluated per grouping set, with the grouping expressions that a grouping set
+    # does not group by replaced by None outside of aggregates
+    if isinstance(expr, Order):
+        order = copy.copy(expr)
+        order.expr = _by_grouping_set(expr.expr, grouping_exprs, grouping_set_indexes)
+        return order
+    grouping_keys = [tree.key(e) for e in grouping_exprs]
+    variants = []
+    for indexes in grouping_set_indexes:
+        ungrouped_keys = {k for i, k in enumerate(grouping_keys) if i not in indexes and k is not None}
+
+        def ungroup(node, ungrouped_keys=ungrouped_keys):
+            if isinstance(node, Aggregate):
+                return node
+            if tree.key(node) in ungrouped_keys:
+                return Literal(None)
+            return None
+        variants.append(tree.replace(expr, ungroup))
+    if all(variant is expr for variant in variants):
+        return expr
+    return _ByGroupingSet(variants)
+
+
+class _FactIn(BaseExpr):
+    # Replaces a predicate on a concept's value once the facts that satisfy it are known
+    __slots__ = ('name', 'facts', 'expr')
+
+    def __init__(self, name, facts, expr: BaseExpr):
+        self.name = name
+        self.facts = facts
+        self.expr = expr
+
+    def evaluate(self, fact_or_set_or_list, evaluator):
+        if isinstance(fact_or_set_or_list, list):
+            return [self.evaluate(fs, evaluator) for fs in fact_or_set_or_list]
+        return fact_or_set_or_list.by_concept(evaluator).get(self.name) in self.facts
+
+    def evaluate_display(self, evaluator, show='label'):
+        return self.expr.evaluate_display(evaluator, show=show)
+
+    def __repr__(self):
+        return repr(self.expr)
+
+
+class _GroupingSetList(list):
+    # The fact set list of a group of one of the grouping sets of a query
+    __slots__ = ('grouping_set',)
+
+    def __init__(self, grouping_set):
+        super(_GroupingSetList, self).__init__()
+        self.grouping_set = grouping_set
+
+
+class _CheckedList(list):
+    # The fact set list of a group of a monitored query, which checks the progress of
+    # the query periodically while it is iterated so that aggregates over huge groups
+    # can be stopped. grouping_set is as in _GroupingSetList.
+    __slots__ = ('grouping_set', 'progress')
+
+    def __init__(self, grouping_set, progress):
+        super(_CheckedList, self).__init__()
+        self.grouping_set = grouping_set
+        self.progress = progress
+
+    def __iter__(self):
+        return self.progress.iterate(super(_CheckedList, self).__iter__())
+
+
+class _ByGroupingSet(BaseExpr):
+    # Evaluates the variant of an expression for the grouping set of each group
+    __slots__ = ('exprs',)
+    FIELDS = (('exprs', 'expr_list'),)
+
+    def __init__(self, exprs):
+        self.exprs = exprs
+
+    @property
+    def is_aggregate(self):
+        return any(e.is_aggregate for e in self.exprs)
+
+    def evaluate(self, fact_set_list, evaluator):
+        return self.exprs[fact_set_list.grouping_set].evaluate(fact_set_list, evaluator)
+
+    def evaluate_aggregate(self, fact_set_list, evaluator):
+        return self.exprs[fact_set_list.grouping_set].evaluate_aggregate(fact_set_list, evaluator)
+
+    def evaluate_display(self, evaluator, show='label'):
+        return self.exprs[0].evaluate_display(evaluator, show=show)
+
+    def __repr__(self):
+        return repr(self.exprs[0])
+
+
+class _GroupingSetIndex(BaseExpr):
+    # The marker column of grouping set queries: the index of the grouping set of each row
+    __slots__ = ()
+
+    @property
+    def is_aggregate(self):
+        return True
+
+    def evaluate(self, fact_set_list, evaluator):
+        return fact_set_list.grouping_set
+
+    def evaluate_display(self, evaluator, show='label'):
+        return 'grouping_set'
+
+    def __repr__(self):
+        return '{}()'.format(type(self).__name__)
+
+
+class _Progress(object):
+    # Tracks the progress of a query for the monitors attached to it (such as a
+    # MemoryTracker or a Deadline), which are notified at the start of each stage and checked
+    # periodically inside the loops of the stages.
+    CHECK_EVERY = 64
+    # Rows per check of vectorized evaluation, which is only efficient over many rows
+    CHECK_EVERY_VECTORIZED = 256
+
+    def __init__(self, monitors=()):
+        self.monitors = [m for m in monitors if m is not None]
+        self.stats = {'stage': None}
+
+    def start(self):
+        for monitor in self.monitors:
+            monitor.start(self.stats)
+
+    def stage(self, name, **counts):
+        self.stats.update(counts)
+        self.stats['stage'] = name
+        for monitor in self.monitors:
+            monitor.stage(name, self.stats)
+
+    def check(self):
+        for monitor in self.monitors:
+            monitor.check(self.stats)
+
+    def stop(self):
+        for monitor in self.monitors:
+            monitor.stop(self.stats)
+
+    def iterate(self, iterable):
+        if not self.monitors:
+            return iterable
+        return self._iterate(iterable)
+
+    def _iterate(self, iterable):
+        for i, item in enumerate(iterable):
+            if i % self.CHECK_EVERY == 0:
+                self.check()
+            yield item
+
+    def map_chunks(self, fn, items, size=CHECK_EVERY):
+        # fn(items) for a function from a list to a list, applied to slices of the list
+        # with a check before each when there are monitors
+        if not self.monitors:
+            return fn(items)
+        result = []
+        for i in range(0, len(items), size):
+            self.check()
+            result.extend(fn(items[i:i + size]))
+        return result
+
+
+_NO_PROGRESS = _Progress()
+
+
 class QExecutor(object):
-    def __init__(self, evaluator: ExprEvaluator):
+    """Runs query specs against the facts of an ExprEvaluator.
+
+    A QExecutor holds no per-query state: the fact sets, groups and expression caches
+    of a query are created by query() and dropped when it returns. One executor (and
+    its evaluator) can therefore serve queries from many threads at the same time,
+    provided the evaluator is safe for concurrent reads as RLExprEvaluator is.
+    """
+    def __init__(self, evaluator: ExprEvaluator, metrics=None):
         self.evaluator = evaluator
+        # Optional rlq.instrument.Metrics that sampled queries report their
+        # expression evaluations and dropped fact sets to
+        self.metrics = metrics
 
     def get(self, concept):
         query_spec = {
@@ -68,41 +388,256 @@ class QExecutor(object):
         }
         return self.query(query_spec)
 
-    def query(self, query_spec):
+    def query(self, query_spec, memory_tracker=None, deadline=None, cancel_token=None):
+        """Run a query spec and return its output.
+
+        memory_tracker is an optional rlq.memory.MemoryTracker that records the memory
+        allocated by each stage of the query and aborts it when over budget.
+
+        deadline is an optional rlq.cancel.Deadline, or a number of seconds from now, and
+        cancel_token an optional rlq.cancel.CancellationToken. The query is aborted with
+        QueryTimeout or QueryCancelled once the deadline passes or the token is cancelled.
+        """
+        if deadline is not None and not isinstance(deadline, Deadline):
+            deadline = Deadline.after(deadline)
+        # The deadline and token come first so that a query that is already late or
+        # cancelled stops before the memory tracker starts tracing
+        progress = _Progress([deadline, cancel_token, memory_tracker])
+        progress.start()
+        try:
+            return self._query(query_spec, progress)
+        finally:
+            progress.stop()
+
+    def _query(self, query_spec, progress):
         header_exprs, select_exprs = _get_select_exprs(query_spec)
-        where_exprs = _get_where_exprs(query_spec)
-        ctx_groupby_exprs = list(query_spec.get('context_groupby', [p.ContextID()]))
+        join = _get_join(query_spec)
+        if join is None:
+            where_exprs = _get_where_exprs(query_spec)
+            ctx_groupby_exprs = list(query_spec.get('context_groupby', [p.ContextID()]))
+        else:
+            # The sub-selections of the join select the facts and their default where
+            # clause applies, so the where clause only filters the joined fact sets
+            where_exprs = list(query_spec.get('where', []))
+            ctx_groupby_exprs = []
         groupby_exprs = list(query_spec.get('groupby', []))
+        grouping_sets = _get_grouping_sets(query_spec)
         having_exprs = list(query_spec.get('having', []))
+        order_by_exprs = _get_order_by_exprs(query_spec)
+        limit = query_spec.get('limit')
+        offset = query_spec.get('offset', 0)
+        pivot_expr = query_spec.get('pivot')
+        pivot_value_exprs = list(query_spec.get('pivot_values', []))
+        header_display = query_spec.get('header_display', 'label')
+        output_format = query_spec.get('output_format', 'row_wise_dicts')
 
         # Identify all concept names mentioned in the query
-        all_exprs = select_exprs + where_exprs + ctx_groupby_exprs + groupby_exprs + having_exprs
-        concept_names = set()
-        for expr in all_exprs:
-            concept_names |= expr.concept_names
+        concept_names = get_concept_names(query_spec)
+
+        grouping_set_exprs = [e for exprs in grouping_sets or [] for e in exprs]
+        for expr in (where_exprs + ctx_groupby_exprs + groupby_exprs + grouping_set_exprs + having_exprs
+                     + pivot_value_exprs):
+            if any(isinstance(e, Window) for e in tree.walk(expr)):
+                raise ValueError('Window expressions can only be used in the select and order_by clauses')
+        if pivot_expr is not None:
+            if (groupby_exprs or grouping_sets is not None or having_exprs or order_by_exprs or limit is not None
+                    or offset):
+                raise ValueError('pivot cannot be combined with groupby, grouping_sets, rollup, having, order_by, '
+                                 'limit or offset')
+            if any(e.is_aggregate for e in select_exprs + [pivot_expr]):
+                raise ValueError('The select and pivot expressions of a pivot query cannot be aggregates')
+            if any(isinstance(e, Window) for expr in select_exprs + [pivot_expr] for e in tree.walk(expr)):
+                raise ValueError('Window expressions cannot be used in a pivot query')
 
-        facts = self._get_facts(concept_names)
-        fact_sets = self._get_fact_sets(facts, ctx_groupby_exprs, where_exprs)
+        grouping_set_indexes = None
+        if grouping_sets is not None:
+            if not any(e.is_aggregate for e in select_exprs):
+                raise ValueError('grouping_sets and rollup can only be used in aggregate queries')
+            if any(isinstance(e, Window) for expr in select_exprs + order_by_exprs for e in tree.walk(expr)):
+                raise ValueError('Window expressions cannot be used with grouping_sets or rollup')
+            # Group by all the grouping expressions at once, and evaluate the other clauses
+            # per grouping set
+            groupby_exprs, grouping_set_indexes = _index_grouping_sets(groupby_exprs, grouping_sets)
+            select_exprs, having_exprs, order_by_exprs = [
+                [_by_grouping_set(e, groupby_exprs, grouping_set_indexes) for e in exprs]
+                for exprs in (select_exprs, having_exprs, order_by_exprs)]
+
+        where_exprs = [self._plan_where_expr(e) for e in where_exprs]
+        fact_ins = [e for e in where_exprs if isinstance(e, _FactIn)]
+        fy_facts = self._get_fy_facts(where_exprs)
+
+        # Evaluate structurally identical subexpressions only once per fact set or group
+        pivot_exprs = [pivot_expr] if pivot_expr is not None else []
+        (select_exprs, where_exprs, groupby_exprs, having_exprs, order_by_exprs, pivot_exprs,
+         pivot_value_exprs) = tree.share_common_subexprs(
+            [select_exprs, where_exprs, groupby_exprs, having_exprs, order_by_exprs, pivot_exprs, pivot_value_exprs],
+            skip_types=(Literal, Constant, Year, Distinct))
+
+        where_dropped = None
+        if self.metrics is not None and self.metrics.start_query():
+            (select_exprs, where_exprs, ctx_groupby_exprs, groupby_exprs, having_exprs, order_by_exprs,
+             pivot_exprs, pivot_value_exprs) = [
+                self.metrics.count_evaluations(clause, exprs) for clause, exprs in (
+                    ('select', select_exprs), ('where', where_exprs), ('context_groupby', ctx_groupby_exprs),
+                    ('groupby', groupby_exprs), ('having', having_exprs), ('order_by', order_by_exprs),
+                    ('pivot', pivot_exprs), ('pivot_values', pivot_value_exprs))]
+            where_dropped = collections.Counter()
+        pivot_expr = pivot_exprs[0] if pivot_exprs else None
+        if grouping_set_indexes is not None:
+            header_exprs.append('grouping_set')
+            select_exprs.append(_GroupingSetIndex())
+
+        progress.stage('facts')
+        if join is not None:
+            fact_sets = self._get_joined_fact_sets(*join, progress=progress)
+            fact_sets = self._filter_fact_sets(fact_sets, where_exprs, where_dropped, progress=progress)
+        else:
+            facts = self._get_facts(concept_names)
+            # Skip the facts and fact sets that cannot pass the indexed predicates, except in
+            # sampled queries, which count the fact sets dropped by each predicate
+            group_keys = None
+            if where_dropped is None:
+                if fy_facts is not None:
+                    facts = facts & fy_facts
+                group_keys = self._get_group_keys(fact_ins, ctx_groupby_exprs)
+            progress.stage('fact_sets', facts=len(facts))
+            fact_sets = self._get_fact_sets(facts, ctx_groupby_exprs, where_exprs, where_dropped,
+                                            group_keys=group_keys, progress=progress)
+        if where_dropped is not None:
+            self.metrics.add_where_dropped(where_dropped)
+
+        if pivot_expr is not None:
+            progress.stage('columns', fact_sets=len(fact_sets))
+            column_values, pivot_header_values = self._get_pivot_columns(
+                fact_sets, select_exprs, pivot_expr, pivot_value_exprs, query_spec.get('pivot_columns'),
+                header_display, progress=progress)
+            header_values = self._get_header_values(header_exprs, header_display) + pivot_header_values
+            progress.stage('output', rows=len(column_values[0]) if column_values else 0)
+            return self._format_output(column_values, header_values, output_format, progress=progress)
 
         is_agg_query = any(e.is_aggregate for e in select_exprs)
+        fact_set_lists = None
         if is_agg_query:
-            fact_set_lists = self._get_fact_set_lists(fact_sets, groupby_exprs, having_exprs)
+            progress.stage('groups', fact_sets=len(fact_sets))
+            fact_set_lists = self._get_fact_set_lists(fact_sets, groupby_exprs, having_exprs,
+                                                      grouping_sets=grouping_set_indexes, progress=progress)
+        progress.stage('columns', fact_sets=len(fact_sets),
+                       groups=len(fact_set_lists) if fact_set_lists is not None else None)
+
+        # Compute window expressions over all the rows at once
+        bound_windows = {}
+
+        def bind_window(expr):
+            if isinstance(expr, Window):
+                if id(expr) not in bound_windows:
+                    rows = fact_set_lists if expr.is_aggregate else fact_sets
+                    bound_windows[id(expr)] = expr.bind(rows, self.evaluator)
+                return bound_windows[id(expr)]
+            return expr
+        select_exprs = [tree.transform(e, bind_window) for e in select_exprs]
+        order_by_exprs = [tree.transform(e, bind_window) for e in order_by_exprs]
+
+        if order_by_exprs or limit is not None or offset:
+            rows = self._get_ordered_rows(progress.iterate(fact_set_lists if is_agg_query else fact_sets),
+                                          select_exprs, order_by_exprs, limit, offset, is_agg_query,
+                                          skip_empty='row_wise' in output_format)
+            column_values = [list(column) for column in zip(*rows)] if rows else [[] for _ in select_exprs]
+        elif is_agg_query:
             # Generate output columns
             column_values = []
             for select_expr in select_exprs:
-                column = [select_expr.evaluate_aggregate(fsl, self.evaluator) for fsl in fact_set_lists]
+                column = [select_expr.evaluate_aggregate(fsl, self.evaluator)
+                          for fsl in progress.iterate(fact_set_lists)]
                 column_values.append(column)
         else:
             # Generate output columns
             column_values = []
             for select_expr in select_exprs:
-                column = select_expr.evaluate(fact_sets, self.evaluator)
+                progress.check()
+                if len(fact_sets) >= vectorized.MIN_ROWS and vectorized.supports(select_expr):
+                    column = progress.map_chunks(
+                        functools.partial(vectorized.evaluate, select_expr, evaluator=self.evaluator),
+                        fact_sets, progress.CHECK_EVERY_VECTORIZED)
+                elif isinstance(select_expr, Distinct):
+                    # Distinct values over all the rows at once
+                    column = select_expr.evaluate(fact_sets, self.evaluator)
+                else:
+                    column = progress.map_chunks(
+                        functools.partial(select_expr.evaluate, evaluator=self.evaluator), fact_sets)
                 column_values.append(column)
 
         # Create output
-        header_display = query_spec.get('header_display', 'label')
-        output_format = query_spec.get('output_format', 'row_wise_dicts')
-        return self._format_output(column_values, header_exprs, header_display, output_format)
+        progress.stage('output', rows=len(column_values[0]) if column_values else 0)
+        header_values = self._get_header_values(header_exprs, header_display)
+        return self._format_output(column_values, header_values, output_format, progress=progress)
+
+    async def query_async(self, query_spec, executor=None, memory_tracker=None, deadline=None, cancel_token=None):
+        """Run query() in a concurrent.futures executor without blocking the event loop.
+
+        executor defaults to the event loop's default thread pool. Unless a cancel_token is
+        given, cancelling the awaiting task cancels the query too: it stops at its next
+        check if it is already running.
+        """
+        if deadline is not None and not isinstance(deadline, Deadline):
+            # Counted from now rather than from when a worker picks the query up
+            deadline = Deadline.after(deadline)
+        own_token = cancel_token is None
+        if own_token:
+            cancel_token = CancellationToken()
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(executor, functools.partial(
+                self.query, query_spec, memory_tracker=memory_tracker, deadline=deadline, cancel_token=cancel_token))
+        except asyncio.CancelledError:
+            if own_token:
+                cancel_token.cancel()
+            raise
+
+    def _plan_where_expr(self, expr):
+        # Answer text, comparison and membership predicates on a concept's value from
+        # the evaluator's text and value indexes
+        if (isinstance(expr, BinaryExpr)
+                and type(expr.operand1) is p.ConceptValue and expr.operand1.name is not None
+                and expr.operand1.default is None
+                and isinstance(expr.operand2, Literal) and expr.operand2.value is not None):
+            name = expr.operand1.name
+            value = expr.operand2.value
+            facts = None
+            if expr.opname in TEXT_OPS and isinstance(value, str):
+                facts = self.evaluator.search_text(name, expr.opname, value)
+            elif expr.opname in VALUE_OPS:
+                facts = self.evaluator.search_value(name, expr.opname, value)
+            if facts is not None:
+                return _FactIn(name, facts, expr)
+        return expr
+
+    def _get_fy_facts(self, where_exprs):
+        # All the facts in the FYs allowed by comparisons of FY() in the where clause, or
+        # None if the evaluator cannot tell. Every fact of a fact set has the same FY, so
+        # the other facts cannot be part of a fact set that passes the where clause.
+        fy_facts = None
+        for expr in where_exprs:
+            if (isinstance(expr, BinaryExpr) and expr.opname in VALUE_OPS and type(expr.operand1) is p.FY
+                    and isinstance(expr.operand2, (Literal, Year))):
+                try:
+                    year = expr.operand2.evaluate(None, self.evaluator)
+                except IndexError:
+                    # A relative year (e.g. FY.PREV) that is older than any FY of the
+                    # instance, which no fact set can be compared with
+                    fy_facts = frozenset()
+                    break
+                facts = self.evaluator.search_fy(expr.opname, year) if year is not None else None
+                if facts is not None:
+                    fy_facts = facts if fy_facts is None else fy_facts & facts
+        return fy_facts
+
+    def _get_group_keys(self, fact_ins, ctx_groupby_exprs):
+        # Keys of the only fact sets that can pass the most selective indexed predicate,
+        # so that no other fact set is built and filtered
+        if not fact_ins:
+            return None
+        fact_in = min(fact_ins, key=lambda e: len(e.facts))
+        return {tuple(e.evaluate(f, self.evaluator) for e in ctx_groupby_exprs) for f in fact_in.facts}
 
     def _get_facts(self, concept_names):
         # Extract facts of all the mentioned concepts
@@ -115,39 +650,206 @@ class QExecutor(object):
                 facts |= self.evaluator.get_facts(concept_name)
         return facts
 
-    def _get_fact_sets(self, facts, ctx_groupby_exprs, where_exprs):
+    def _get_fact_sets(self, facts, ctx_groupby_exprs, where_exprs, where_dropped=None, group_keys=None,
+                       progress=_NO_PROGRESS):
         # Group facts into fact sets
-        fact_sets = collections.defaultdict(FactSet)
-        for fact in facts:
+        grouped_facts = collections.defaultdict(list)
+        for fact in progress.iterate(facts):
             group_key = tuple(e.evaluate(fact, self.evaluator) for e in ctx_groupby_exprs)
-            fact_sets[group_key].add(fact)
-        fact_sets = list(fact_sets.values())
+            if group_keys is not None and group_key not in group_keys:
+                continue
+            grouped_facts[group_key].append(fact)
+        fact_sets = [FactSet(group_facts) for group_facts in grouped_facts.values()]
+        return self._filter_fact_sets(fact_sets, where_exprs, where_dropped, progress=progress)
 
+    def _filter_fact_sets(self, fact_sets, where_exprs, where_dropped=None, progress=_NO_PROGRESS):
         # Apply all filters on the fact sets
-        filtered_fact_sets = [fs for fs in fact_sets if all(e.evaluate(fs, self.evaluator) for e in where_exprs)]
+        if where_dropped is None:
+            if len(fact_sets) >= vectorized.MIN_ROWS and any(vectorized.supports(e) for e in where_exprs):
+                # Filter column-wise, one predicate at a time over the fact sets that passed the previous ones
+                for expr in where_exprs:
+                    progress.check()
+                    fact_sets = progress.map_chunks(
+                        functools.partial(vectorized.filter_fact_sets, expr, evaluator=self.evaluator),
+                        fact_sets, progress.CHECK_EVERY_VECTORIZED)
+                return fact_sets
+            return [fs for fs in progress.iterate(fact_sets)
+                    if all(e.evaluate(fs, self.evaluator) for e in where_exprs)]
+
+        # Same, counting the fact sets dropped by each predicate
+        filtered_fact_sets = []
+        for fact_set in progress.iterate(fact_sets):
+            failed_expr = next((e for e in where_exprs if not e.evaluate(fact_set, self.evaluator)), None)
+            if failed_expr is None:
+                filtered_fact_sets.append(fact_set)
+            else:
+                where_dropped[repr(failed_expr)] += 1
         return filtered_fact_sets
 
-    def _get_fact_set_lists(self, fact_sets, groupby_exprs, having_exprs):
+    def _get_joined_fact_sets(self, left, right, how, progress=_NO_PROGRESS):
+        # Hash join of the fact sets of the two sub-selections of a join clause. The right
+        # fact sets are hashed on their key values, and each left fact set is merged with
+        # every right fact set with the same key or, in a left join, kept on its own if
+        # there is none. As in SQL, keys with a None value match nothing.
+        sides = []
+        for side in (left, right):
+            where_exprs = [self._plan_where_expr(e) for e in side.where_exprs]
+            facts = self._get_facts(side.concept_names)
+            fy_facts = self._get_fy_facts(where_exprs)
+            if fy_facts is not None:
+                facts = facts & fy_facts
+            sides.append((side, where_exprs, facts))
+        progress.stage('fact_sets', facts=sum(len(facts) for _, _, facts in sides))
+        left_fact_sets, right_fact_sets = [
+            self._get_fact_sets(facts, side.ctx_groupby_exprs, where_exprs,
+                                group_keys=self._get_group_keys([e for e in where_exprs if isinstance(e, _FactIn)],
+                                                                side.ctx_groupby_exprs),
+                                progress=progress)
+            for side, where_exprs, facts in sides]
+
+        hashed_fact_sets = collections.defaultdict(list)
+        for fact_set in progress.iterate(right_fact_sets):
+            join_key = tuple(e.evaluate(fact_set, self.evaluator) for e in right.key_exprs)
+            if not any(v is None for v in join_key):
+                hashed_fact_sets[join_key].append(fact_set)
+
+        joined_fact_sets = []
+        for fact_set in progress.iterate(left_fact_sets):
+            join_key = tuple(e.evaluate(fact_set, self.evaluator) for e in left.key_exprs)
+            matches = hashed_fact_sets.get(join_key, ()) if not any(v is None for v in join_key) else ()
+            for match in matches:
+                # The two sides select different concepts and therefore different facts
+                joined_fact_sets.append(FactSet(fact_set.facts + match.facts))
+            if not matches and how == 'left':
+                joined_fact_sets.append(fact_set)
+        return joined_fact_sets
+
+    def _get_fact_set_lists(self, fact_sets, groupby_exprs, having_exprs, grouping_sets=None,
+                            progress=_NO_PROGRESS):
         # Evaluate groupby clause
-        grouped_fact_sets = collections.defaultdict(list)
-        for fact_set in fact_sets:
-            group_key = tuple(e.evaluate(fact_set, self.evaluator) for e in groupby_exprs)
-            grouped_fact_sets[group_key].append(fact_set)
-        grouped_fact_sets = list(grouped_fact_sets.values())
+        if grouping_sets is None:
+            new_list = functools.partial(_CheckedList, None, progress) if progress.monitors else list
+            grouped_fact_sets = collections.defaultdict(new_list)
+            for fact_set in progress.iterate(fact_sets):
+                group_key = tuple(e.evaluate(fact_set, self.evaluator) for e in groupby_exprs)
+                grouped_fact_sets[group_key].append(fact_set)
+            grouped_fact_sets = list(grouped_fact_sets.values())
+        else:
+            # Group the fact sets by every grouping set in a single pass, evaluating the
+            # grouping expressions once per fact set
+            new_list = functools.partial(_CheckedList, progress=progress) if progress.monitors else _GroupingSetList
+            groups = [{} for _ in grouping_sets]
+            for fact_set in progress.iterate(fact_sets):
+                values = tuple(e.evaluate(fact_set, self.evaluator) for e in groupby_exprs)
+                for i, indexes in enumerate(grouping_sets):
+                    group_key = tuple(values[j] for j in indexes)
+                    fact_set_list = groups[i].get(group_key)
+                    if fact_set_list is None:
+                        fact_set_list = groups[i][group_key] = new_list(i)
+                    fact_set_list.append(fact_set)
+            grouped_fact_sets = [fsl for grouping_set_groups in groups for fsl in grouping_set_groups.values()]
 
         # Evaluate having clause
-        filtered_fact_set_lists = [fsl for fsl in grouped_fact_sets if
+        filtered_fact_set_lists = [fsl for fsl in progress.iterate(grouped_fact_sets) if
                                    all(e.evaluate_aggregate(fsl, self.evaluator) for e in having_exprs)]
 
         return filtered_fact_set_lists
 
-    def _format_output(self, column_values, header_exprs, header_display, output_format):
-        header_values = [e.evaluate_display(self.evaluator, show=header_display)
-                         if not isinstance(e, str) else e for e in header_exprs]
+    def _evaluate_row(self, exprs, row, is_agg_query):
+        if is_agg_query:
+            return tuple(e.evaluate_aggregate(row, self.evaluator) for e in exprs)
+        return tuple(e.evaluate(row, self.evaluator) for e in exprs)
+
+    def _get_ordered_rows(self, rows, select_exprs, order_by_exprs, limit, offset, is_agg_query, skip_empty):
+        # Only the first offset + limit rows are needed. They are kept in a bounded heap
+        # whose top is the current worst row, and the select expressions are only
+        # evaluated for rows that sort ahead of it.
+        n = offset + limit if limit is not None else None
+        if n == 0:
+            return []
+        if not order_by_exprs:
+            selected = []
+            for row in rows:
+                values = self._evaluate_row(select_exprs, row, is_agg_query)
+                if skip_empty and all(v is None for v in values):
+                    continue
+                selected.append(values)
+                if n is not None and len(selected) >= n:
+                    break
+            return selected[offset:]
+
+        heap = []
+        for i, row in enumerate(rows):
+            order_values = self._evaluate_row(order_by_exprs, row, is_agg_query)
+            key = tuple(e.sort_key(v) for e, v in zip(order_by_exprs, order_values)) + (i,)
+            is_full = n is not None and len(heap) >= n
+            if is_full and not key < heap[0][0].value:
+                continue
+            values = self._evaluate_row(select_exprs, row, is_agg_query)
+            if skip_empty and all(v is None for v in values):
+                continue
+            if is_full:
+                heapq.heapreplace(heap, (_Reversed(key), values))
+            else:
+                heapq.heappush(heap, (_Reversed(key), values))
+        heap.sort(key=lambda entry: entry[0].value)
+        return [values for _, values in heap[offset:]]
+
+    def _get_pivot_columns(self, fact_sets, select_exprs, pivot_expr, value_exprs, pivot_columns, header_display,
+                           progress=_NO_PROGRESS):
+        # Build the cells of the wide table in one pass over the fact sets. Each row is
+        # identified by the values of the select expressions and each column by the value
+        # of the pivot expression.
+        fixed_columns = set(pivot_columns) if pivot_columns is not None else None
+        cells = {}
+        discovered_columns = {}
+        for fact_set in progress.iterate(fact_sets):
+            column = pivot_expr.evaluate(fact_set, self.evaluator)
+            if fixed_columns is not None and column not in fixed_columns:
+                continue
+            row_key = tuple(e.evaluate(fact_set, self.evaluator) for e in select_exprs)
+            row_cells = cells.get(row_key)
+            if row_cells is None:
+                row_cells = cells[row_key] = collections.defaultdict(list)
+            row_cells[column].append(fact_set)
+            discovered_columns[column] = None
+
+        if pivot_columns is None:
+            try:
+                pivot_columns = sorted(discovered_columns)
+            except TypeError:
+                pivot_columns = list(discovered_columns)
+
+        column_values = [[row_key[i] for row_key in cells] for i in range(len(select_exprs))]
+        for column in progress.iterate(pivot_columns):
+            for value_expr in value_exprs:
+                column_values.append([self._evaluate_cell(value_expr, row_cells.get(column))
+                                      for row_cells in progress.iterate(cells.values())])
+
+        value_header_values = [e.evaluate_display(self.evaluator, show=header_display) for e in value_exprs]
+        if len(value_exprs) == 1:
+            header_values = list(pivot_columns)
+        else:
+            header_values = [(h, column) for column in pivot_columns for h in value_header_values]
+        return column_values, header_values
+
+    def _evaluate_cell(self, value_expr, fact_set_list):
+        if not fact_set_list:
+            return None
+        if value_expr.is_aggregate:
+            return value_expr.evaluate_aggregate(fact_set_list, self.evaluator)
+        return next((v for v in value_expr.evaluate(fact_set_list, self.evaluator) if v is not None), None)
+
+    def _get_header_values(self, header_exprs, header_display):
+        return [e.evaluate_display(self.evaluator, show=header_display)
+                if not isinstance(e, str) else e for e in header_exprs]
+
+    @staticmethod
+    def _format_output(column_values, header_values, output_format, progress=_NO_PROGRESS):
         if 'row_wise' in output_format:
             transposed = zip(*column_values)
             output = []
-            for row_values in transposed:
+            for row_values in progress.iterate(transposed):
                 if any(v is not None for v in row_values):
                     if 'dict' in output_format:
                         output.append(dict(zip(header_values, row_values)))
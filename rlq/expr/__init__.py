@@ -1,5 +1,8 @@
 from .base import Literal, Constant
 from .distinct import Distinct
 from .year import Year, Y
+from .order import Asc, Desc
+from .window import Lag, Lead, Change, PctChange
 from .aggregate import *
+from .sketch import ApproxCountDistinct, ApproxQuantile
 from .properties import *
@@ -1,3 +1,4 @@
+import functools
 import operator
 import re
 
@@ -22,12 +23,17 @@ lt = operator.lt
 le = operator.le
 
 
+@functools.lru_cache(maxsize=256)
+def _compile(pattern, flags=0):
+    return re.compile(pattern, flags)
+
+
 def regex(value1, value2):
-    return bool(re.match(value2, value1))
+    return bool(_compile(value2).match(value1))
 
 
 def iregex(value1, value2):
-    return bool(re.match(value2, value1, re.I))
+    return bool(_compile(value2, re.I).match(value1))
 
 
 def contains(value1, value2):
@@ -1,9 +1,19 @@
 import abc
+import decimal
+import fractions
+import functools
+import math
+import operator
 
 from rlq.expr.base import BaseExpr
 
+__all__ = ['Aggregate', 'First', 'Last', 'Count', 'Min', 'Max', 'Sum', 'Avg', 'Join', 'Percentile', 'Median']
+
 
 class Aggregate(BaseExpr, metaclass=abc.ABCMeta):
+    __slots__ = ('expr', 'ignore_none', 'empty')
+    FIELDS = (('expr', 'expr'), ('ignore_none', 'value'), ('empty', 'value'))
+
     def __init__(self, expr: BaseExpr, ignore_none=True, empty=None):
         assert not expr.is_aggregate, 'Cannot create aggregate of an aggregate'
         self.expr = expr
@@ -23,14 +33,18 @@ class Aggregate(BaseExpr, metaclass=abc.ABCMeta):
         return True
 
     def evaluate(self, fact_or_set_or_list, evaluator):
-        assert isinstance(fact_or_set_or_list, list)
-        values = self.expr.evaluate(fact_or_set_or_list, evaluator)
-        if self.ignore_none:
-            values = [v for v in values if v is not None]
+        values = self.evaluate_values(fact_or_set_or_list, evaluator)
         if not values:
             return self.empty
         return self.aggregate(values)
 
+    def evaluate_values(self, fact_set_list, evaluator):
+        assert isinstance(fact_set_list, list)
+        values = self.expr.evaluate(fact_set_list, evaluator)
+        if self.ignore_none:
+            values = [v for v in values if v is not None]
+        return values
+
     def evaluate_display(self, evaluator, show='label'):
         return '{}({})'.format(type(self).__name__.upper(),
                                self.expr.evaluate_display(evaluator, show=show))
@@ -39,36 +53,100 @@ class Aggregate(BaseExpr, metaclass=abc.ABCMeta):
     def aggregate(self, values):
         raise NotImplementedError
 
+    # Mergeable partial state, used to maintain the aggregate over many instances
+    # without keeping all their values (see rlq.materialized). partial() takes the
+    # values of one instance after ignore_none is applied, merge() combines the states
+    # of several instances in order and finalize() computes the aggregate of the merged
+    # state. The default state is the list of values, which grows with every merge; the
+    # aggregates that can be computed from less keep a state of fixed size instead.
+
+    def partial(self, values):
+        return list(values)
+
+    def merge(self, states):
+        return [v for state in states for v in state]
+
+    def finalize(self, state):
+        if not state:
+            return self.empty
+        return self.aggregate(state)
+
     def __repr__(self):
         return '{}({})'.format(type(self).__name__, self.expr)
 
 
 class First(Aggregate):
+    __slots__ = ()
+
     def aggregate(self, values):
         return values[0]
 
+    def partial(self, values):
+        return list(values[:1])
+
+    def merge(self, states):
+        return next((state for state in states if state), [])
+
 
 class Last(Aggregate):
+    __slots__ = ()
+
     def aggregate(self, values):
         return values[-1]
 
+    def partial(self, values):
+        return list(values[-1:])
+
+    def merge(self, states):
+        return next((state for state in reversed(states) if state), [])
+
 
 class Count(Aggregate):
+    __slots__ = ()
+
     def aggregate(self, values):
         return len(values)
 
+    def partial(self, values):
+        return len(values)
+
+    def merge(self, states):
+        return sum(states)
+
+    def finalize(self, state):
+        return state if state else self.empty
+
 
 class Min(Aggregate):
+    __slots__ = ()
+
     def aggregate(self, values):
         return min(values)
 
+    def partial(self, values):
+        return [min(values)] if values else []
+
+    def merge(self, states):
+        return self.partial([v for state in states for v in state])
+
 
 class Max(Aggregate):
+    __slots__ = ()
+
     def aggregate(self, values):
         return max(values)
 
+    def partial(self, values):
+        return [max(values)] if values else []
+
+    def merge(self, states):
+        return self.partial([v for state in states for v in state])
+
 
 class Sum(Aggregate):
+    __slots__ = ('start',)
+    FIELDS = (('expr', 'expr'), ('start', 'value'), ('ignore_none', 'value'), ('empty', 'value'))
+
     def __init__(self, expr, start=0, ignore_none=True, empty=None):
         super(Sum, self).__init__(expr, ignore_none, empty)
         self.start = start
@@ -76,16 +154,91 @@ class Sum(Aggregate):
     def aggregate(self, values):
         return sum(values, self.start)
 
+    def partial(self, values):
+        # The start value is added once, when the merged state is finalized
+        return _total(values)
+
+    def merge(self, states):
+        return _total([v for state in states for v in state])
+
 
 class Avg(Sum):
+    __slots__ = ()
+
     def aggregate(self, values):
         return sum(values, self.start) / len(values)
 
+    def partial(self, values):
+        return _total(values), len(values)
+
+    def merge(self, states):
+        return _total([v for totals, _ in states for v in totals]), sum(count for _, count in states)
+
+    def finalize(self, state):
+        totals, count = state
+        if not count:
+            return self.empty
+        return sum(totals, self.start) / count
+
 
 class Join(Aggregate):
+    __slots__ = ('sep',)
+    FIELDS = (('expr', 'expr'), ('sep', 'value'), ('ignore_none', 'value'), ('empty', 'value'))
+
     def __init__(self, expr, sep=', ', ignore_none=True, empty=None):
         super(Join, self).__init__(expr, ignore_none, empty)
         self.sep = sep
 
     def aggregate(self, values):
         return self.sep.join(values)
+
+
+class Percentile(Aggregate):
+    """Exact percentile with linear interpolation between the closest values.
+
+    q is the percentile as a fraction between 0 and 1.
+    """
+    __slots__ = ('q',)
+    FIELDS = (('expr', 'expr'), ('q', 'value'), ('ignore_none', 'value'), ('empty', 'value'))
+
+    def __init__(self, expr, q, ignore_none=True, empty=None):
+        super(Percentile, self).__init__(expr, ignore_none, empty)
+        if not 0 <= q <= 1:
+            raise ValueError('q must be between 0 and 1')
+        self.q = q
+
+    def aggregate(self, values):
+        values = sorted(values)
+        rank = fractions.Fraction(self.q) * (len(values) - 1)
+        low = math.floor(rank)
+        if rank == low:
+            return values[low]
+        return _interpolate(values[low], values[low + 1], rank - low)
+
+    def __repr__(self):
+        return '{}({}, {})'.format(type(self).__name__, self.expr, self.q)
+
+
+class Median(Percentile):
+    __slots__ = ()
+    FIELDS = (('expr', 'expr'), ('ignore_none', 'value'), ('empty', 'value'))
+
+    def __init__(self, expr, ignore_none=True, empty=None):
+        super(Median, self).__init__(expr, 0.5, ignore_none, empty)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, self.expr)
+
+
+def _total(values):
+    # The total of the values as a state of at most one value
+    return [functools.reduce(operator.add, values)] if values else []
+
+
+def _interpolate(low, high, weight: fractions.Fraction):
+    # Keep Decimal and Fraction values exact, like their arithmetic does
+    if isinstance(low, decimal.Decimal) or isinstance(high, decimal.Decimal):
+        weight = decimal.Decimal(weight.numerator) / decimal.Decimal(weight.denominator)
+    elif not (isinstance(low, fractions.Fraction) or isinstance(high, fractions.Fraction)):
+        weight = float(weight)
+    return low + (high - low) * weight
@@ -1,5 +1,4 @@
 import abc
-from typing import Set
 
 from rlq.evaluators.base import ExprEvaluator
 from rlq.expr import _op
@@ -8,6 +7,12 @@ DEBUG = True
 
 
 class BaseExpr(object, metaclass=abc.ABCMeta):
+    # Constructor arguments as (attribute, kind) pairs, in constructor order.
+    # kind is one of 'value', 'expr', 'exprs' (variadic expressions), 'expr_list'
+    # (a sequence of expressions passed as a single argument) or 'op'.
+    __slots__ = ()
+    FIELDS = ()
+
     @abc.abstractmethod
     def evaluate(self, fact_or_set_or_list, evaluator: ExprEvaluator):
         raise NotImplementedError
@@ -28,7 +33,7 @@ class BaseExpr(object, metaclass=abc.ABCMeta):
             return self.evaluate(first_fact_set, evaluator)
 
     @property
-    def concept_names(self) -> Set[str]:
+    def concept_names(self) -> set:
         return set()
 
     @property
@@ -126,12 +131,18 @@ class BaseExpr(object, metaclass=abc.ABCMeta):
 
 
 class Literal(BaseExpr):
+    __slots__ = ('value',)
+    FIELDS = (('value', 'value'),)
+
     def __init__(self, value):
         self.value = value
 
     def evaluate(self, fact_or_set_or_list, evaluator):
         return self.value
 
+    def evaluate_aggregate(self, fact_set_list, evaluator):
+        return self.value
+
     def evaluate_display(self, evaluator, show='label'):
         return str(self.value)
 
@@ -140,6 +151,9 @@ class Literal(BaseExpr):
 
 
 class Constant(BaseExpr):
+    __slots__ = ('value',)
+    FIELDS = (('value', 'value'),)
+
     def __init__(self, value: str):
         self.value = value
 
@@ -154,6 +168,9 @@ class Constant(BaseExpr):
 
 
 class BinaryExpr(BaseExpr):
+    __slots__ = ('operator', 'operand1', 'operand2')
+    FIELDS = (('operator', 'op'), ('operand1', 'expr'), ('operand2', 'expr'))
+
     def __init__(self, operator, operand1, operand2):
         self.operator = operator
         self.operand1 = self.ensure_expr(operand1)
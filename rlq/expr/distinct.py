@@ -2,6 +2,9 @@ from rlq.expr.base import BaseExpr
 
 
 class Distinct(BaseExpr):
+    __slots__ = ('exprs', 'ignore_none')
+    FIELDS = (('exprs', 'exprs'), ('ignore_none', 'value'))
+
     def __init__(self, expr: BaseExpr, *exprs: BaseExpr, ignore_none=False):
         self.exprs = (expr,) + exprs
         self.ignore_none = ignore_none
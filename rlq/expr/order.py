@@ -0,0 +1,60 @@
+from rlq.expr.base import BaseExpr
+
+
+class _Reversed(object):
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+class Order(BaseExpr):
+    __slots__ = ('expr', 'nulls_first')
+    FIELDS = (('expr', 'expr'), ('nulls_first', 'value'))
+    descending = False
+
+    def __init__(self, expr: BaseExpr, nulls_first=False):
+        self.expr = expr
+        self.nulls_first = nulls_first
+
+    @property
+    def concept_names(self):
+        return self.expr.concept_names
+
+    @property
+    def has_dimension_property(self):
+        return self.expr.has_dimension_property
+
+    @property
+    def is_aggregate(self):
+        return self.expr.is_aggregate
+
+    def evaluate(self, fact_or_set_or_list, evaluator):
+        return self.expr.evaluate(fact_or_set_or_list, evaluator)
+
+    def evaluate_display(self, evaluator, show='label'):
+        return '{} {}'.format(self.expr.evaluate_display(evaluator, show=show),
+                              'DESC' if self.descending else 'ASC')
+
+    def sort_key(self, value):
+        if value is None:
+            return (0,) if self.nulls_first else (2,)
+        return 1, _Reversed(value) if self.descending else value
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, self.expr)
+
+
+class Asc(Order):
+    __slots__ = ()
+
+
+class Desc(Order):
+    __slots__ = ()
+    descending = True
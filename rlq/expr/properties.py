@@ -7,6 +7,8 @@ from rlq.fact_set import FactSet
 
 
 class Property(BaseExpr, metaclass=abc.ABCMeta):
+    __slots__ = ()
+
     def evaluate(self, fact_or_set_or_list, evaluator):
         if isinstance(fact_or_set_or_list, list):
             return [self.evaluate(fs, evaluator) for fs in fact_or_set_or_list]
@@ -31,12 +33,15 @@ class Property(BaseExpr, metaclass=abc.ABCMeta):
     def __repr__(self):
         prop_type = type(self).__name__
         attrs = []
-        for attr, value in self.__dict__.items():
-            attrs.append('{}={}'.format(attr, value))
+        for attr, _ in type(self).FIELDS:
+            attrs.append('{}={}'.format(attr, getattr(self, attr)))
         return '{}({})'.format(prop_type, ', '.join(attrs))
 
 
 class ConceptProperty(Property, metaclass=abc.ABCMeta):
+    __slots__ = ('name', 'label_role')
+    FIELDS = (('name', 'value'), ('label_role', 'value'))
+
     def __init__(self, name: str=None, label_role=None):
         self.name = name
         self.label_role = label_role
@@ -67,21 +72,30 @@ class ConceptProperty(Property, metaclass=abc.ABCMeta):
 
 
 class Concept(ConceptProperty):
+    __slots__ = ()
+
     def evaluate_fact(self, fact, evaluator):
         return evaluator.get_concept(fact, self.name)
 
 
 class ConceptName(ConceptProperty):
+    __slots__ = ()
+
     def evaluate_fact(self, fact, evaluator):
         return evaluator.get_concept_name(fact, self.name)
 
 
 class ConceptLabel(ConceptProperty):
+    __slots__ = ()
+
     def evaluate_fact(self, fact, evaluator):
         return evaluator.get_concept_label(fact, self.name, self.label_role)
 
 
 class ConceptValue(ConceptProperty):
+    __slots__ = ('default',)
+    FIELDS = (('name', 'value'), ('default', 'value'), ('label_role', 'value'))
+
     def __init__(self, name, default=None, label_role=None):
         super(ConceptValue, self).__init__(name, label_role)
         self.default = default
@@ -96,16 +110,21 @@ C = ConceptValue
 
 
 class ContextProperty(Property, metaclass=abc.ABCMeta):
-    pass
+    __slots__ = ()
 
 
 class DimProperty(ContextProperty, metaclass=abc.ABCMeta):
+    __slots__ = ()
+
     @property
     def has_dimension_property(self):
         return True
 
 
 class DimValProperty(DimProperty, metaclass=abc.ABCMeta):
+    __slots__ = ('axis_name', 'include_defaults', 'label_role')
+    FIELDS = (('axis_name', 'value'), ('include_defaults', 'value'), ('label_role', 'value'))
+
     def __init__(self, axis_name=None, include_defaults=True, label_role=None):
         self.axis_name = axis_name
         self.include_defaults = include_defaults
@@ -124,21 +143,29 @@ class DimValProperty(DimProperty, metaclass=abc.ABCMeta):
 
 
 class DimMember(DimValProperty):
+    __slots__ = ()
+
     def evaluate_fact(self, fact, evaluator):
         return evaluator.get_dim_member(fact, self.axis_name, self.include_defaults)
 
 
 class DimMemberName(DimValProperty):
+    __slots__ = ()
+
     def evaluate_fact(self, fact, evaluator):
         return evaluator.get_dim_member_name(fact, self.axis_name, self.include_defaults)
 
 
 class DimMemberLabel(DimValProperty):
+    __slots__ = ()
+
     def evaluate_fact(self, fact, evaluator):
         return evaluator.get_dim_member_label(fact, self.axis_name, self.include_defaults, self.label_role)
 
 
 class DimMemberValue(DimValProperty):
+    __slots__ = ()
+
     def evaluate_fact(self, fact, evaluator):
         return evaluator.get_dim_member_value(fact, self.axis_name, self.include_defaults, self.label_role)
 
@@ -149,6 +176,8 @@ D = DimMemberValue
 
 
 class DimAxes(DimProperty):
+    __slots__ = ()
+
     def evaluate_fact(self, fact, evaluator):
         return evaluator.get_dim_axes(fact)
 
@@ -163,10 +192,13 @@ Ax = DimAxes
 
 
 class PeriodProperty(ContextProperty, metaclass=abc.ABCMeta):
-    pass
+    __slots__ = ()
 
 
 class Period(PeriodProperty):
+    __slots__ = ('forever_dt',)
+    FIELDS = (('forever_dt', 'value'),)
+
     def __init__(self, forever_dt=None):
         self.forever_dt = forever_dt
 
@@ -178,6 +210,9 @@ class Period(PeriodProperty):
 
 
 class PeriodStr(PeriodProperty):
+    __slots__ = ('instant_format', 'duration_format', 'forever_format')
+    FIELDS = (('instant_format', 'value'), ('duration_format', 'value'), ('forever_format', 'value'))
+
     def __init__(self, instant_format='{:%d/%m/%Y}', duration_format='{0:%d/%m/%Y} to {1:%d/%m/%Y}',
                  forever_format=''):
         self.instant_format = instant_format
@@ -192,6 +227,8 @@ class PeriodStr(PeriodProperty):
 
 
 class StartDatetime(PeriodProperty):
+    __slots__ = ()
+
     def evaluate_fact(self, fact, evaluator):
         return evaluator.get_start_datetime(fact)
 
@@ -200,6 +237,8 @@ class StartDatetime(PeriodProperty):
 
 
 class EndDatetime(PeriodProperty):
+    __slots__ = ()
+
     def evaluate_fact(self, fact, evaluator):
         return evaluator.get_end_datetime(fact)
 
@@ -208,6 +247,8 @@ class EndDatetime(PeriodProperty):
 
 
 class EndDate(PeriodProperty):
+    __slots__ = ()
+
     def evaluate_fact(self, fact, evaluator):
         return evaluator.get_end_date(fact)
 
@@ -216,6 +257,7 @@ class EndDate(PeriodProperty):
 
 
 class FY(PeriodProperty):
+    __slots__ = ()
     CURR = Year('curr')
     PREV = Year('prev')
     PREV_PREV = Year('prev_prev')
@@ -228,6 +270,8 @@ class FY(PeriodProperty):
 
 
 class ContextID(ContextProperty):
+    __slots__ = ()
+
     def evaluate_fact(self, fact, evaluator):
         return evaluator.get_context_id(fact)
 
@@ -239,6 +283,8 @@ CtxID = ContextID
 
 
 class ContextHashNoPeriodType(ContextProperty):
+    __slots__ = ()
+
     def evaluate_fact(self, fact, evaluator):
         return evaluator.get_context_hash_no_period_type(fact)
 
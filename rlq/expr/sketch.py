@@ -0,0 +1,153 @@
+"""Approximate aggregates with bounded, mergeable state.
+
+Their partial states (see Aggregate.partial()) are made of plain lists, dicts and
+numbers, so they can be serialized and merged across groups, filings and processes.
+"""
+import decimal
+import fractions
+import hashlib
+import math
+
+from rlq.expr.aggregate import Aggregate
+
+
+def _canonical(value):
+    # Values that compare equal (e.g. 1, 1.0 and True) get the same bytes, as they would in a set
+    if isinstance(value, (int, float, decimal.Decimal, fractions.Fraction)):
+        try:
+            return 'n:{}'.format(fractions.Fraction(value)).encode()
+        except (ValueError, OverflowError):
+            # NaN and infinities
+            return 'n:{}'.format(float(value)).encode()
+    if isinstance(value, str):
+        return b's:' + value.encode('utf-8', 'surrogatepass')
+    return '{}:{!r}'.format(type(value).__name__, value).encode('utf-8', 'surrogatepass')
+
+
+def _hash64(value):
+    # Stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(_canonical(value), digest_size=8).digest(), 'big')
+
+
+class ApproxCountDistinct(Aggregate):
+    """Approximate number of distinct values, using a HyperLogLog sketch.
+
+    The state has 2 ** precision registers and the relative standard error of the
+    estimate is about 1.04 / sqrt(2 ** precision), i.e. 1.6% for the default precision.
+    """
+    __slots__ = ('precision',)
+    FIELDS = (('expr', 'expr'), ('precision', 'value'), ('ignore_none', 'value'), ('empty', 'value'))
+
+    def __init__(self, expr, precision=12, ignore_none=True, empty=None):
+        super(ApproxCountDistinct, self).__init__(expr, ignore_none, empty)
+        if not 4 <= precision <= 16:
+            raise ValueError('precision must be between 4 and 16')
+        self.precision = precision
+
+    def aggregate(self, values):
+        return self.finalize(self.partial(values))
+
+    def partial(self, values):
+        registers = [0] * (1 << self.precision)
+        value_bits = 64 - self.precision
+        for value in values:
+            h = _hash64(value)
+            index = h >> value_bits
+            rest = h & ((1 << value_bits) - 1)
+            rank = value_bits - rest.bit_length() + 1
+            if rank > registers[index]:
+                registers[index] = rank
+        return registers
+
+    def merge(self, states):
+        return [max(ranks) for ranks in zip(*states)] if states else [0] * (1 << self.precision)
+
+    def finalize(self, state):
+        if not any(state):
+            return self.empty
+        m = len(state)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in state)
+        zeros = state.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, self.expr)
+
+
+class ApproxQuantile(Aggregate):
+    """Approximate quantile, using a KLL sketch.
+
+    q is the quantile as a fraction between 0 and 1 and the result is one of the values.
+    The sketch keeps O(k log(n / k)) values and the rank error is about 1.7 / k of the
+    number of values (under 1% for the default k). It is exact while fewer than k values
+    have been added.
+    """
+    __slots__ = ('q', 'k')
+    FIELDS = (('expr', 'expr'), ('q', 'value'), ('k', 'value'), ('ignore_none', 'value'), ('empty', 'value'))
+
+    def __init__(self, expr, q=0.5, k=200, ignore_none=True, empty=None):
+        super(ApproxQuantile, self).__init__(expr, ignore_none, empty)
+        if not 0 <= q <= 1:
+            raise ValueError('q must be between 0 and 1')
+        self.q = q
+        self.k = k
+
+    def aggregate(self, values):
+        return self.finalize(self.partial(values))
+
+    def _capacity(self, level, num_levels):
+        return max(2, int(math.ceil(self.k * (2 / 3) ** (num_levels - level - 1))))
+
+    def _compress(self, state):
+        levels = state['levels']
+        level = 0
+        while level < len(levels):
+            if len(levels[level]) >= self._capacity(level, len(levels)):
+                if level + 1 == len(levels):
+                    levels.append([])
+                items = sorted(levels[level])
+                # Alternate which half is kept so that the errors of compactions cancel out
+                offset = state['offset']
+                state['offset'] = 1 - offset
+                levels[level] = [items.pop()] if len(items) % 2 else []
+                levels[level + 1].extend(items[offset::2])
+            level += 1
+        return state
+
+    def partial(self, values):
+        state = {'levels': [[]], 'offset': 0}
+        for value in values:
+            state['levels'][0].append(value)
+            if len(state['levels'][0]) >= self.k:
+                self._compress(state)
+        return self._compress(state)
+
+    def merge(self, states):
+        merged = {'levels': [[]], 'offset': 0}
+        for state in states:
+            for level, items in enumerate(state['levels']):
+                if level == len(merged['levels']):
+                    merged['levels'].append([])
+                merged['levels'][level].extend(items)
+            merged['offset'] ^= state['offset']
+        return self._compress(merged)
+
+    def finalize(self, state):
+        weighted = sorted((value, 1 << level) for level, items in enumerate(state['levels']) for value in items)
+        if not weighted:
+            return self.empty
+        total = sum(weight for _, weight in weighted)
+        target = self.q * total
+        cumulative = 0
+        for value, weight in weighted:
+            cumulative += weight
+            if cumulative >= target:
+                return value
+        return weighted[-1][0]
+
+    def __repr__(self):
+        return '{}({}, {})'.format(type(self).__name__, self.expr, self.q)
@@ -0,0 +1,185 @@
+import collections
+import copy
+
+from rlq.expr.base import BaseExpr
+
+
+def children(expr: BaseExpr):
+    for attr, kind in type(expr).FIELDS:
+        if kind == 'expr':
+            yield getattr(expr, attr)
+        elif kind in ('exprs', 'expr_list'):
+            yield from getattr(expr, attr)
+
+
+def walk(expr: BaseExpr):
+    yield expr
+    for child in children(expr):
+        yield from walk(child)
+
+
+def transform(expr: BaseExpr, fn):
+    """Rebuild an expression tree bottom-up, replacing every node with fn(node).
+
+    Nodes are shallow-copied when one of their children changes, so the original tree
+    is never modified.
+    """
+    changes = {}
+    for attr, kind in type(expr).FIELDS:
+        if kind == 'expr':
+            child = getattr(expr, attr)
+            new_child = transform(child, fn)
+            if new_child is not child:
+                changes[attr] = new_child
+        elif kind in ('exprs', 'expr_list'):
+            exprs = getattr(expr, attr)
+            new_exprs = tuple(transform(e, fn) for e in exprs)
+            if any(new is not old for new, old in zip(new_exprs, exprs)):
+                changes[attr] = new_exprs
+    if changes:
+        expr = copy.copy(expr)
+        for attr, value in changes.items():
+            setattr(expr, attr, value)
+    return fn(expr)
+
+
+def replace(expr: BaseExpr, fn):
+    """Rebuild an expression tree top-down, replacing nodes with fn(node).
+
+    fn returns the replacement of a node, whose subtree is then not visited, or None to
+    keep the node and visit its children. As with transform(), the original tree is
+    never modified.
+    """
+    new_expr = fn(expr)
+    if new_expr is not None:
+        return new_expr
+    changes = {}
+    for attr, kind in type(expr).FIELDS:
+        if kind == 'expr':
+            child = getattr(expr, attr)
+            new_child = replace(child, fn)
+            if new_child is not child:
+                changes[attr] = new_child
+        elif kind in ('exprs', 'expr_list'):
+            exprs = getattr(expr, attr)
+            new_exprs = tuple(replace(e, fn) for e in exprs)
+            if any(new is not old for new, old in zip(new_exprs, exprs)):
+                changes[attr] = new_exprs
+    if changes:
+        expr = copy.copy(expr)
+        for attr, value in changes.items():
+            setattr(expr, attr, value)
+    return expr
+
+
+class _Unhashable(Exception):
+    pass
+
+
+def _value_key(value):
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__,) + tuple(_value_key(v) for v in value)
+    elif isinstance(value, (set, frozenset)):
+        return type(value).__name__, frozenset(_value_key(v) for v in value)
+    elif isinstance(value, dict):
+        return 'dict', frozenset((_value_key(k), _value_key(v)) for k, v in value.items())
+    try:
+        hash(value)
+    except TypeError:
+        raise _Unhashable
+    return type(value).__name__, value
+
+
+def _key(expr):
+    if isinstance(expr, _Shared):
+        return _key(expr.expr)
+    cls = type(expr)
+    if cls.__name__.startswith('_'):
+        raise _Unhashable
+    parts = [cls]
+    for attr, kind in cls.FIELDS:
+        value = getattr(expr, attr)
+        if kind == 'expr':
+            parts.append(_key(value))
+        elif kind in ('exprs', 'expr_list'):
+            parts.append(tuple(_key(e) for e in value))
+        elif kind == 'op':
+            parts.append(value)
+        else:
+            parts.append(_value_key(value))
+    return tuple(parts)
+
+
+def key(expr: BaseExpr):
+    """Hashable key that is equal for structurally identical expressions, or None."""
+    try:
+        return _key(expr)
+    except _Unhashable:
+        return None
+
+
+class _Shared(BaseExpr):
+    __slots__ = ('expr', 'cache')
+    FIELDS = (('expr', 'expr'),)
+
+    def __init__(self, expr: BaseExpr):
+        self.expr = expr
+        self.cache = {}
+
+    @property
+    def concept_names(self):
+        return self.expr.concept_names
+
+    @property
+    def has_dimension_property(self):
+        return self.expr.has_dimension_property
+
+    @property
+    def is_aggregate(self):
+        return self.expr.is_aggregate
+
+    def evaluate(self, fact_or_set_or_list, evaluator):
+        if not self.is_aggregate and isinstance(fact_or_set_or_list, list):
+            return [self.evaluate(fs, evaluator) for fs in fact_or_set_or_list]
+        # The evaluated object is kept alongside its value so that its id cannot be reused
+        try:
+            return self.cache[id(fact_or_set_or_list)][1]
+        except KeyError:
+            value = self.expr.evaluate(fact_or_set_or_list, evaluator)
+            self.cache[id(fact_or_set_or_list)] = (fact_or_set_or_list, value)
+            return value
+
+    def evaluate_display(self, evaluator, show='label'):
+        return self.expr.evaluate_display(evaluator, show=show)
+
+    def __repr__(self):
+        return repr(self.expr)
+
+
+def share_common_subexprs(expr_lists, skip_types=()):
+    """Rewrite lists of expressions so that structurally identical subexpressions are evaluated once.
+
+    Every subexpression that occurs more than once across all the lists is replaced by a
+    single node that caches its value per fact set (or fact set list). The caches live in
+    the returned expressions, so they are only shared within one query.
+    """
+    counts = collections.Counter()
+    for exprs in expr_lists:
+        for expr in exprs:
+            for node in walk(expr):
+                if not isinstance(node, skip_types):
+                    counts[key(node)] += 1
+
+    shared = {}
+
+    def share(node):
+        if isinstance(node, skip_types):
+            return node
+        node_key = key(node)
+        if node_key is None or counts[node_key] < 2:
+            return node
+        if node_key not in shared:
+            shared[node_key] = _Shared(node)
+        return shared[node_key]
+
+    return [[transform(expr, share) for expr in exprs] for exprs in expr_lists]
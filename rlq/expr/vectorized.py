@@ -0,0 +1,186 @@
+"""Column-at-a-time evaluation of BinaryExpr trees with NumPy.
+
+BinaryExpr.evaluate() handles one fact set at a time. Here each property at the leaves
+of an expression tree is evaluated once for all the fact sets into an object array, and
+every operator is applied to whole arrays, with the same results as the per fact set
+evaluation:
+    - a missing (None) operand gives None for arithmetic and False for boolean operators
+    - the second operand is only evaluated for the fact sets where the first is not None
+    - the operators are applied to the same Python values, so Decimal, Fraction, date and
+      string values keep their exact semantics
+
+Where both operands are plain Python floats, or integers small enough to be exact as
+floats, arithmetic and comparisons run on native NumPy arrays. Everything else applies
+the Python operator over the arrays.
+
+NumPy is optional and only imported by the first call to supports() for an expression
+that could be vectorized. When it is not installed, supports() returns False and the
+executor keeps evaluating one fact set at a time.
+"""
+from rlq.expr import _op
+from rlq.expr.base import BinaryExpr, Constant, Literal
+from rlq.expr.year import Year
+
+# Below this number of fact sets the per fact set evaluation is just as fast
+MIN_ROWS = 32
+
+# Integers up to this magnitude are exact as floats
+_MAX_EXACT_INT = 2 ** 53
+# Integer products are computed natively only below this magnitude to avoid overflow
+_MAX_MUL_INT = 2 ** 31
+
+_COMPARISONS = {_op.eq: 'equal', _op.ne: 'not_equal', _op.gt: 'greater', _op.ge: 'greater_equal',
+                _op.lt: 'less', _op.le: 'less_equal'}
+_ARITHMETIC = {_op.add: 'add', _op.sub: 'subtract', _op.mul: 'multiply', _op.truediv: 'true_divide'}
+
+
+np = None
+_numpy_imported = False
+
+
+def _import_numpy():
+    global np, _numpy_imported
+    if not _numpy_imported:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        np = numpy
+        _numpy_imported = True
+    return np
+
+
+def supports(expr):
+    return isinstance(expr, BinaryExpr) and not expr.is_aggregate and _import_numpy() is not None
+
+
+def evaluate(expr: BinaryExpr, fact_sets, evaluator):
+    """The value of expr for each fact set, as a list."""
+    if not supports(expr):
+        return [expr.evaluate(fs, evaluator) for fs in fact_sets]
+    return _evaluate(expr, list(fact_sets), evaluator).tolist()
+
+
+def filter_fact_sets(expr, fact_sets, evaluator):
+    """The fact sets for which expr is true."""
+    if not supports(expr):
+        return [fs for fs in fact_sets if expr.evaluate(fs, evaluator)]
+    fact_sets = list(fact_sets)
+    return [fs for fs, v in zip(fact_sets, _evaluate(expr, fact_sets, evaluator)) if v]
+
+
+class _Scalar(object):
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+
+def _object_array(values):
+    # Filled one by one so that tuple values are not unpacked into a second dimension
+    array = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        array[i] = value
+    return array
+
+
+def _object_scalar(value):
+    # A 0-d array, so that containers (e.g. the set of an in_ predicate) broadcast as one value
+    array = np.empty((), dtype=object)
+    array[()] = value
+    return array
+
+
+def _operand(expr, fact_sets, evaluator):
+    if isinstance(expr, (Literal, Constant, Year)):
+        return _Scalar(expr.evaluate(None, evaluator))
+    if supports(expr):
+        return _evaluate(expr, fact_sets, evaluator)
+    return _object_array([expr.evaluate(fs, evaluator) for fs in fact_sets])
+
+
+def _evaluate(expr: BinaryExpr, fact_sets, evaluator):
+    result = _object_array([expr.missing_operand_value] * len(fact_sets))
+    rows = np.arange(len(fact_sets))
+
+    values1 = _operand(expr.operand1, fact_sets, evaluator)
+    if isinstance(values1, _Scalar):
+        if values1.value is None:
+            return result
+    else:
+        present = np.fromiter((v is not None for v in values1), dtype=bool, count=len(values1))
+        rows = rows[present]
+        values1 = values1[present]
+        if not len(rows):
+            return result
+        if len(rows) < len(fact_sets):
+            fact_sets = [fact_sets[i] for i in rows]
+
+    values2 = _operand(expr.operand2, fact_sets, evaluator)
+    if isinstance(values2, _Scalar):
+        if values2.value is None:
+            return result
+    else:
+        present = np.fromiter((v is not None for v in values2), dtype=bool, count=len(values2))
+        rows = rows[present]
+        values2 = values2[present]
+        if not isinstance(values1, _Scalar):
+            values1 = values1[present]
+        if not len(rows):
+            return result
+
+    if isinstance(values1, _Scalar) and isinstance(values2, _Scalar):
+        value = expr.operator(values1.value, values2.value)
+        for i in rows:
+            result[i] = value
+    else:
+        result[rows] = _apply(expr.operator, values1, values2)
+    return result
+
+
+def _numeric(values):
+    # Native array for an operand whose values are all floats or exact integers, else None
+    items = [values.value] if isinstance(values, _Scalar) else values
+    kinds = {type(v) for v in items}
+    if kinds == {float}:
+        dtype = np.float64
+    elif kinds == {int} and all(-_MAX_EXACT_INT < v < _MAX_EXACT_INT for v in items):
+        dtype = np.int64
+    else:
+        return None
+    if isinstance(values, _Scalar):
+        return np.asarray(values.value, dtype=dtype)
+    return values.astype(dtype)
+
+
+def _apply(operator, values1, values2):
+    name = _COMPARISONS.get(operator) or _ARITHMETIC.get(operator)
+    if name is not None:
+        array1 = _numeric(values1)
+        array2 = _numeric(values2) if array1 is not None else None
+        if array2 is not None and _is_exact(operator, array1, array2):
+            if operator in _COMPARISONS or operator is _op.truediv:
+                array1 = array1.astype(np.float64)
+                array2 = array2.astype(np.float64)
+            # Python float arithmetic overflows to inf without raising as well
+            with np.errstate(all='ignore'):
+                return getattr(np, name)(array1, array2).tolist()
+
+    # Apply the Python operator to every pair of values
+    if isinstance(values1, _Scalar):
+        values1 = _object_scalar(values1.value)
+    if isinstance(values2, _Scalar):
+        values2 = _object_scalar(values2.value)
+    # NumPy values among the operands warn where the Python values would not
+    with np.errstate(all='ignore'):
+        return np.frompyfunc(operator, 2, 1)(values1, values2)
+
+
+def _is_exact(operator, array1, array2):
+    # Whether the native operation gives the same result as the Python operator
+    if operator is _op.truediv:
+        # Python raises ZeroDivisionError, which the Python operator path reproduces
+        return not np.any(array2 == 0)
+    if operator is _op.mul and array1.dtype == np.int64 and array2.dtype == np.int64:
+        return bool(np.all(np.abs(array1) < _MAX_MUL_INT) and np.all(np.abs(array2) < _MAX_MUL_INT))
+    return True
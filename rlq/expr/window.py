@@ -0,0 +1,156 @@
+import abc
+import collections
+
+from rlq.expr.base import BaseExpr
+from rlq.expr.properties import FY
+
+
+class Window(BaseExpr, metaclass=abc.ABCMeta):
+    """Value of an expression in an earlier or later period of the same partition.
+
+    The rows of the query (fact sets, or fact set lists for aggregate expressions) are
+    split into partitions by the partition expressions and ordered by the distinct values
+    of the by expression within each partition. offset counts those distinct values, so
+    Lag(C(x), by=FY()) refers to the closest earlier FY present in the partition. Each
+    period can only occur in one row of a partition.
+    """
+    __slots__ = ('expr', 'by', 'partition', 'offset', 'default')
+    FIELDS = (('expr', 'expr'), ('by', 'expr'), ('partition', 'expr_list'), ('offset', 'value'),
+              ('default', 'value'))
+    direction = -1
+
+    def __init__(self, expr: BaseExpr, by: BaseExpr=None, partition=None, offset=1, default=None):
+        self.expr = expr
+        self.by = by if by is not None else FY()
+        if partition is None:
+            partition = ()
+        elif isinstance(partition, BaseExpr):
+            partition = (partition,)
+        self.partition = tuple(partition)
+        self.offset = offset
+        self.default = default
+
+    @property
+    def concept_names(self):
+        concept_names = self.expr.concept_names | self.by.concept_names
+        for expr in self.partition:
+            concept_names |= expr.concept_names
+        return concept_names
+
+    @property
+    def has_dimension_property(self):
+        return (self.expr.has_dimension_property or self.by.has_dimension_property
+                or any(e.has_dimension_property for e in self.partition))
+
+    @property
+    def is_aggregate(self):
+        return self.expr.is_aggregate
+
+    def evaluate(self, fact_or_set_or_list, evaluator):
+        raise ValueError('{} can only be used in the select and order_by clauses'.format(type(self).__name__))
+
+    def evaluate_display(self, evaluator, show='label'):
+        return '{}({} BY {})'.format(type(self).__name__.upper(),
+                                     self.expr.evaluate_display(evaluator, show=show),
+                                     self.by.evaluate_display(evaluator, show=show))
+
+    def window_value(self, value, other_value):
+        return other_value
+
+    def bind(self, rows, evaluator):
+        """Compute the window over all the rows of a query in a single pass."""
+        if self.is_aggregate:
+            def evaluate(e, row):
+                return e.evaluate_aggregate(row, evaluator)
+        else:
+            def evaluate(e, row):
+                return e.evaluate(row, evaluator)
+
+        # Index the expression values by partition and period
+        row_keys = []
+        row_values = []
+        period_values = collections.defaultdict(dict)
+        for row in rows:
+            partition = tuple(evaluate(e, row) for e in self.partition)
+            period = evaluate(self.by, row)
+            value = evaluate(self.expr, row)
+            row_keys.append((partition, period))
+            row_values.append(value)
+            if period is not None:
+                values = period_values[partition]
+                if period in values:
+                    raise ValueError(
+                        'Duplicate period {} in partition {} of {}. Add partition expressions or where '
+                        'clauses to ensure each period occurs in only 1 row of each partition.'.format(
+                            period, partition, type(self).__name__))
+                values[period] = value
+
+        # Locate the other period for each row
+        period_positions = {}
+        for partition, values in period_values.items():
+            periods = sorted(values)
+            period_positions[partition] = periods, {period: i for i, period in enumerate(periods)}
+        values = {}
+        for row, (partition, period), value in zip(rows, row_keys, row_values):
+            other_value = None
+            if period is not None:
+                periods, positions = period_positions[partition]
+                i = positions[period] + self.direction * self.offset
+                if 0 <= i < len(periods):
+                    other_value = period_values[partition][periods[i]]
+            window_value = self.window_value(value, other_value)
+            values[id(row)] = window_value if window_value is not None else self.default
+        return _BoundWindow(self, values)
+
+    def __repr__(self):
+        return '{}({}, by={})'.format(type(self).__name__, self.expr, self.by)
+
+
+class Lag(Window):
+    __slots__ = ()
+
+
+class Lead(Window):
+    __slots__ = ()
+    direction = 1
+
+
+class Change(Window):
+    __slots__ = ()
+
+    def window_value(self, value, other_value):
+        if value is None or other_value is None:
+            return None
+        return value - other_value
+
+
+class PctChange(Window):
+    __slots__ = ()
+
+    def window_value(self, value, other_value):
+        if value is None or not other_value:
+            return None
+        return (value - other_value) / other_value * 100
+
+
+class _BoundWindow(BaseExpr):
+    __slots__ = ('window', 'values')
+
+    def __init__(self, window: Window, values):
+        self.window = window
+        self.values = values
+
+    @property
+    def is_aggregate(self):
+        return self.window.is_aggregate
+
+    def evaluate(self, fact_or_set_or_list, evaluator):
+        if not self.is_aggregate and isinstance(fact_or_set_or_list, list):
+            return [self.values.get(id(fs)) for fs in fact_or_set_or_list]
+        return self.values.get(id(fact_or_set_or_list))
+
+    def evaluate_display(self, evaluator, show='label'):
+        return self.window.evaluate_display(evaluator, show=show)
+
+    def __repr__(self):
+        return repr(self.window)
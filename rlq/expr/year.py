@@ -2,6 +2,9 @@ from rlq.expr.base import BaseExpr
 
 
 class Year(BaseExpr):
+    __slots__ = ('year',)
+    FIELDS = (('year', 'value'),)
+
     def __init__(self, year_spec):
         if year_spec == 'curr':
             self.year = 0
@@ -1,10 +1,31 @@
-class FactSet(set):
+class FactSet(object):
+    """The facts of one context group, as an immutable tuple.
+
+    Fact sets are created by a single query and never shared between threads, so the
+    concept index is built on first use without locking.
+    """
+    __slots__ = ('facts', '_facts_by_concept')
+
+    def __init__(self, facts=()):
+        self.facts = tuple(facts)
+        self._facts_by_concept = None
+
+    def __len__(self):
+        return len(self.facts)
+
+    def __iter__(self):
+        return iter(self.facts)
+
+    def __contains__(self, fact):
+        return fact in self.facts
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.facts)
+
     def by_concept(self, evaluator):
-        try:
-            return self._facts_by_concept
-        except AttributeError:
+        if self._facts_by_concept is None:
             facts_by_concept = {}
-            for fact in self:
+            for fact in self.facts:
                 concept_name = evaluator.get_concept_name(fact, None)
                 if concept_name in facts_by_concept:
                     raise ValueError(
@@ -14,4 +35,4 @@ class FactSet(set):
                             concept_name, type(self).__name__))
                 facts_by_concept[concept_name] = fact
             self._facts_by_concept = facts_by_concept
-            return self._facts_by_concept
+        return self._facts_by_concept
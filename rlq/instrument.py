@@ -0,0 +1,303 @@
+"""Counters for finding where query time goes.
+
+Metrics collects:
+    - calls and time per evaluator method, through an InstrumentedEvaluator
+    - evaluations and time per expression node of a query, by clause
+    - fact sets dropped by each where predicate (by the first predicate that rejects them)
+
+Counting is cheap, timing less so. With sample_every=N only every Nth evaluator call of a
+method is timed (and the reported time is scaled up by N), and only every Nth query
+counts its expression evaluations and dropped fact sets, which keeps the overhead low
+enough to leave on in production.
+
+    metrics = Metrics(sample_every=100)
+    executor = instrument(get_query_executor(file_path), metrics)
+    executor.query(query_spec)
+    print(metrics.to_text())
+"""
+import collections
+import threading
+import time
+import weakref
+
+from rlq.evaluators.base import ExprEvaluator
+from rlq.executor import QExecutor
+from rlq.expr.base import BaseExpr, Constant, Literal
+from rlq.expr.order import Order
+from rlq.expr import tree
+from rlq.expr.year import Year
+
+_NOT_COUNTED = (Literal, Constant, Year, Order, tree._Shared)
+
+# Methods that do not evaluate anything and are passed through without counting
+_UNCOUNTED_METHODS = frozenset(['warm', 'estimated_size', 'close'])
+
+# Indexes of the per thread counters
+_CALLS, _CALL_SECONDS, _EVALUATIONS, _EXPR_SECONDS = range(4)
+
+
+class Metrics(object):
+    def __init__(self, sample_every=1):
+        assert sample_every >= 1
+        self.sample_every = sample_every
+        # Reentrant since the counters of an ended thread are folded from whichever thread frees them
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.queries = 0
+            self.sampled_queries = 0
+            # Evaluator calls and expression evaluations are counted per thread, without
+            # locking, and merged on read. The counters of a thread are folded into the
+            # totals when it ends, so that pools that replace their threads do not pile them up.
+            self._local = threading.local()
+            self._thread_counters = {}
+            self._totals = _new_counters()
+            self.where_dropped = collections.Counter()
+
+    def start_query(self):
+        """Count a query and return whether its expressions should be counted."""
+        with self._lock:
+            self.queries += 1
+            sampled = (self.queries - 1) % self.sample_every == 0
+            self.sampled_queries += sampled
+            return sampled
+
+    def _counters(self):
+        # The counters of the current thread
+        local = self._local
+        try:
+            return local.holder.counters
+        except AttributeError:
+            holder = local.holder = _CountersHolder()
+            with self._lock:
+                self._thread_counters[id(holder)] = holder.counters
+            # The holder is freed with the thread's locals when the thread ends
+            weakref.finalize(holder, _fold_counters, weakref.ref(self), self._thread_counters, self._totals,
+                             id(holder))
+            return holder.counters
+
+    def count_call(self, method_name):
+        """Count an evaluator call and return whether it should be timed.
+
+        Every sample_every-th call of a method in each thread is timed.
+        """
+        calls = self._counters()[_CALLS]
+        calls[method_name] += 1
+        return (calls[method_name] - 1) % self.sample_every == 0
+
+    def add_call_time(self, method_name, seconds):
+        self._counters()[_CALL_SECONDS][method_name] += seconds * self.sample_every
+
+    def _merged_counters(self, index):
+        merged = collections.Counter(self._totals[index])
+        for counters in list(self._thread_counters.values()):
+            # A plain dict copy does not run any Python code, so it sees a consistent
+            # state of a counter that its thread may be updating
+            merged.update(dict(counters[index]))
+        return merged
+
+    @property
+    def evaluator_calls(self):
+        with self._lock:
+            return self._merged_counters(_CALLS)
+
+    @property
+    def evaluator_seconds(self):
+        with self._lock:
+            return self._merged_counters(_CALL_SECONDS)
+
+    @property
+    def expr_evaluations(self):
+        with self._lock:
+            return self._merged_counters(_EVALUATIONS)
+
+    @property
+    def expr_seconds(self):
+        with self._lock:
+            return self._merged_counters(_EXPR_SECONDS)
+
+    def add_evaluation(self, expr_key, seconds):
+        counters = self._counters()
+        counters[_EVALUATIONS][expr_key] += 1
+        counters[_EXPR_SECONDS][expr_key] += seconds
+
+    def add_where_dropped(self, dropped):
+        with self._lock:
+            self.where_dropped.update(dropped)
+
+    def count_evaluations(self, clause, exprs):
+        """Wrap every node of the expressions of a query clause so that its evaluations are counted."""
+        def count(expr):
+            if isinstance(expr, _NOT_COUNTED):
+                return expr
+            return _Counted(expr, self, (clause, repr(expr)))
+        return [tree.transform(e, count) for e in exprs]
+
+    def to_dict(self):
+        with self._lock:
+            evaluator_seconds = self._merged_counters(_CALL_SECONDS)
+            expr_seconds = self._merged_counters(_EXPR_SECONDS)
+            return {
+                'queries': self.queries,
+                'sampled_queries': self.sampled_queries,
+                'evaluator': {name: {'calls': calls, 'seconds': evaluator_seconds[name]}
+                              for name, calls in self._merged_counters(_CALLS).items()},
+                'expressions': {'{}: {}'.format(*expr_key): {'evaluations': n, 'seconds': expr_seconds[expr_key]}
+                                for expr_key, n in self._merged_counters(_EVALUATIONS).items()},
+                'where_dropped': dict(self.where_dropped),
+            }
+
+    def to_text(self, prefix='rlq'):
+        """The counters in the Prometheus text exposition format."""
+        with self._lock:
+            samples = [
+                ('queries_total', 'counter', [({}, self.queries)]),
+                ('sampled_queries_total', 'counter', [({}, self.sampled_queries)]),
+                ('evaluator_calls_total', 'counter',
+                 [({'method': name}, n) for name, n in sorted(self._merged_counters(_CALLS).items())]),
+                ('evaluator_seconds_total', 'counter',
+                 [({'method': name}, s) for name, s in sorted(self._merged_counters(_CALL_SECONDS).items())]),
+                ('expr_evaluations_total', 'counter',
+                 [({'clause': c, 'expr': e}, n) for (c, e), n in sorted(self._merged_counters(_EVALUATIONS).items())]),
+                ('expr_seconds_total', 'counter',
+                 [({'clause': c, 'expr': e}, s) for (c, e), s in sorted(self._merged_counters(_EXPR_SECONDS).items())]),
+                ('where_dropped_total', 'counter',
+                 [({'expr': e}, n) for e, n in sorted(self.where_dropped.items())]),
+            ]
+        lines = []
+        for name, metric_type, values in samples:
+            name = '{}_{}'.format(prefix, name)
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            for labels, value in values:
+                if labels:
+                    label_str = ','.join('{}="{}"'.format(k, _escape_label(v)) for k, v in labels.items())
+                    lines.append('{}{{{}}} {}'.format(name, label_str, value))
+                else:
+                    lines.append('{} {}'.format(name, value))
+        return '\n'.join(lines) + '\n'
+
+
+def _new_counters():
+    return tuple(collections.Counter() for _ in range(4))
+
+
+class _CountersHolder(object):
+    __slots__ = ('counters', '__weakref__')
+
+    def __init__(self):
+        self.counters = _new_counters()
+
+
+def _fold_counters(metrics_ref, thread_counters, totals, key):
+    # Add the counters of an ended thread to the totals they were counted towards, which
+    # are no longer those of the metrics if it was reset since
+    metrics = metrics_ref()
+    if metrics is None:
+        return
+    with metrics._lock:
+        counters = thread_counters.pop(key, None)
+        if counters is not None:
+            for total, counter in zip(totals, counters):
+                total.update(counter)
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _Counted(BaseExpr):
+    __slots__ = ('expr', 'metrics', 'expr_key')
+    FIELDS = (('expr', 'expr'),)
+
+    def __init__(self, expr: BaseExpr, metrics: Metrics, expr_key):
+        self.expr = expr
+        self.metrics = metrics
+        self.expr_key = expr_key
+
+    @property
+    def concept_names(self):
+        return self.expr.concept_names
+
+    @property
+    def has_dimension_property(self):
+        return self.expr.has_dimension_property
+
+    @property
+    def is_aggregate(self):
+        return self.expr.is_aggregate
+
+    def evaluate(self, fact_or_set_or_list, evaluator):
+        start = time.perf_counter()
+        try:
+            return self.expr.evaluate(fact_or_set_or_list, evaluator)
+        finally:
+            self.metrics.add_evaluation(self.expr_key, time.perf_counter() - start)
+
+    def evaluate_aggregate(self, fact_set_list, evaluator):
+        start = time.perf_counter()
+        try:
+            return self.expr.evaluate_aggregate(fact_set_list, evaluator)
+        finally:
+            self.metrics.add_evaluation(self.expr_key, time.perf_counter() - start)
+
+    def evaluate_display(self, evaluator, show='label'):
+        return self.expr.evaluate_display(evaluator, show=show)
+
+    def __repr__(self):
+        return repr(self.expr)
+
+
+class InstrumentedEvaluator(ExprEvaluator):
+    """ExprEvaluator wrapper that counts and times the calls made to another evaluator.
+
+    Calls the wrapped evaluator makes to itself are not seen by the wrapper, which leaves
+    the wrapped evaluator untouched so that it can be shared and wrapped several times.
+    qn() is not counted since the evaluator only calls it itself, to resolve concept names.
+    """
+
+    def __init__(self, evaluator: ExprEvaluator, metrics: Metrics):
+        self.evaluator = evaluator
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        # Evaluator specific attributes (e.g. the Arelle model) are passed through
+        return getattr(self.evaluator, name)
+
+
+def _call(metrics, name, method, args, kwargs):
+    if not metrics.count_call(name):
+        return method(*args, **kwargs)
+    start = time.perf_counter()
+    try:
+        return method(*args, **kwargs)
+    finally:
+        metrics.add_call_time(name, time.perf_counter() - start)
+
+
+def _counted_method(name):
+    def method(self, *args, **kwargs):
+        return _call(self.metrics, name, getattr(self.evaluator, name), args, kwargs)
+    method.__name__ = name
+    return method
+
+
+def _passed_through_method(name):
+    def method(self, *args, **kwargs):
+        return getattr(self.evaluator, name)(*args, **kwargs)
+    method.__name__ = name
+    return method
+
+
+for _name in list(ExprEvaluator.__abstractmethods__) + ['get_entity_identifier', 'search_text', 'search_value',
+                                                     'search_fy']:
+    setattr(InstrumentedEvaluator, _name, _counted_method(_name))
+for _name in _UNCOUNTED_METHODS:
+    setattr(InstrumentedEvaluator, _name, _passed_through_method(_name))
+InstrumentedEvaluator.__abstractmethods__ = frozenset()
+
+
+def instrument(executor: QExecutor, metrics: Metrics):
+    """A QExecutor over the same evaluator that reports to metrics."""
+    return QExecutor(InstrumentedEvaluator(executor.evaluator, metrics), metrics=metrics)
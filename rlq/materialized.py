@@ -0,0 +1,190 @@
+"""Standing queries whose results are maintained incrementally over a growing set of filings.
+
+Each filing contributes its part of the results once, when it is added. Non-aggregate
+queries keep the rows of every filing. Aggregate queries keep, for every group of every
+filing, the partial state of each aggregate (see Aggregate.partial()), and the states of a
+group are merged across filings in the order the filings were added. Adding a filing
+only merges its own groups, and replacing or removing one only re-merges the groups it
+contributed to, so refreshing does not depend on the number of filings already added.
+The states of all aggregates but Join, Percentile and Median are of fixed size, so
+neither do the merged states of a group; those three keep every value.
+"""
+import collections
+import threading
+
+from rlq.evaluators.base import ExprEvaluator
+from rlq.executor import QExecutor, _get_select_exprs, _get_where_exprs, get_concept_names
+from rlq.expr import properties as p
+from rlq.expr import tree
+from rlq.expr.aggregate import Aggregate
+from rlq.expr.base import Literal
+from rlq.expr.distinct import Distinct
+from rlq.expr.window import Window
+
+
+def _merge_partials(aggregates, partials):
+    values = [next((v for v in vs if v is not None), None) for vs in zip(*(values for values, _ in partials))]
+    states = [a.merge(list(ss)) for a, ss in zip(aggregates, zip(*(states for _, states in partials)))]
+    return values, states
+
+
+class MaterializedQuery(object):
+    """Results of a query spec over all the filings added to it.
+
+    Queries with order_by, limit, offset, pivot, grouping_sets, rollup or join, or with
+    window or Distinct expressions, cannot be materialized since their results cannot be
+    assembled from independent parts per filing.
+    """
+
+    def __init__(self, query_spec):
+        if (any(query_spec.get(key) is not None
+                for key in ('order_by', 'limit', 'pivot', 'grouping_sets', 'rollup', 'join'))
+                or query_spec.get('offset')):
+            raise ValueError('Queries with order_by, limit, offset, pivot, grouping_sets, rollup or join cannot '
+                             'be materialized')
+        self.query_spec = query_spec
+        self.header_exprs, self.select_exprs = _get_select_exprs(query_spec)
+        self.where_exprs = _get_where_exprs(query_spec)
+        self.ctx_groupby_exprs = list(query_spec.get('context_groupby', [p.ContextID()]))
+        self.groupby_exprs = list(query_spec.get('groupby', []))
+        self.having_exprs = list(query_spec.get('having', []))
+        self.concept_names = get_concept_names(query_spec)
+        self.header_display = query_spec.get('header_display', 'label')
+        self.output_format = query_spec.get('output_format', 'row_wise_dicts')
+
+        all_exprs = (self.select_exprs + self.where_exprs + self.ctx_groupby_exprs + self.groupby_exprs
+                     + self.having_exprs)
+        if any(isinstance(e, (Window, Distinct)) for expr in all_exprs for e in tree.walk(expr)):
+            raise ValueError('Queries with window or Distinct expressions cannot be materialized')
+
+        self.is_agg_query = any(e.is_aggregate for e in self.select_exprs)
+        self._exprs = self.select_exprs + self.having_exprs
+        self._aggregates = [e for expr in self._exprs for e in tree.walk(expr) if isinstance(e, Aggregate)]
+
+        # filing id -> rows, or group key -> (values, aggregate states) for aggregate queries
+        self._filings = collections.OrderedDict()
+        # group key -> merged (values, aggregate states)
+        self._groups = collections.OrderedDict()
+        # group key -> finalized row, or None if it is filtered out by the having clause
+        self._rows = {}
+        self.header_values = [e if isinstance(e, str) else None for e in self.header_exprs]
+        self._lock = threading.RLock()
+
+    @property
+    def filing_ids(self):
+        return list(self._filings)
+
+    def add_filing(self, filing_id, evaluator: ExprEvaluator):
+        """Add the part of the results coming from a filing, replacing any earlier version of it."""
+        executor = QExecutor(evaluator)
+        where_exprs = [executor._plan_where_expr(e) for e in self.where_exprs]
+        facts = executor._get_facts(self.concept_names)
+        fact_sets = executor._get_fact_sets(facts, self.ctx_groupby_exprs, where_exprs)
+        header_values = executor._get_header_values(self.header_exprs, self.header_display)
+
+        if not self.is_agg_query:
+            part = [tuple(e.evaluate(fs, evaluator) for e in self.select_exprs) for fs in fact_sets]
+        else:
+            groups = collections.OrderedDict()
+            for fact_set in fact_sets:
+                group_key = tuple(e.evaluate(fact_set, evaluator) for e in self.groupby_exprs)
+                groups.setdefault(group_key, []).append(fact_set)
+            part = collections.OrderedDict()
+            for group_key, fact_set_list in groups.items():
+                values = [None if e.is_aggregate else e.evaluate_aggregate(fact_set_list, evaluator)
+                          for e in self._exprs]
+                states = [a.partial(a.evaluate_values(fact_set_list, evaluator)) for a in self._aggregates]
+                part[group_key] = values, states
+
+        with self._lock:
+            old_part = self._filings.get(filing_id)
+            # A replaced filing keeps its place among the filings, on which First and Last depend
+            self._filings[filing_id] = part
+            self.header_values = header_values
+            if not self.is_agg_query:
+                return
+            if old_part is not None:
+                for group_key in list(old_part) + [k for k in part if k not in old_part]:
+                    self._merge_group(group_key)
+                return
+            for group_key, partial in part.items():
+                merged = self._groups.get(group_key)
+                if merged is not None:
+                    partial = _merge_partials(self._aggregates, [merged, partial])
+                self._groups[group_key] = partial
+                self._rows.pop(group_key, None)
+
+    def remove_filing(self, filing_id):
+        with self._lock:
+            part = self._filings.pop(filing_id)
+            if self.is_agg_query:
+                for group_key in part:
+                    self._merge_group(group_key)
+
+    def _merge_group(self, group_key):
+        # Merge the partials of a group from all the filings again, in the order of the filings
+        partials = [f[group_key] for f in self._filings.values() if group_key in f]
+        if partials:
+            self._groups[group_key] = _merge_partials(self._aggregates, partials)
+        else:
+            self._groups.pop(group_key, None)
+        self._rows.pop(group_key, None)
+
+    def _finalize(self, group):
+        values, states = group
+        finalized = {id(a): a.finalize(s) for a, s in zip(self._aggregates, states)}
+
+        def replace_aggregate(expr):
+            return Literal(finalized[id(expr)]) if isinstance(expr, Aggregate) else expr
+
+        row = [tree.transform(e, replace_aggregate).evaluate(None, None) if e.is_aggregate else v
+               for e, v in zip(self._exprs, values)]
+        n = len(self.select_exprs)
+        if not all(row[n:]):
+            return None
+        return tuple(row[:n])
+
+    def result(self, output_format=None):
+        """The current results, formatted like QExecutor.query() would."""
+        with self._lock:
+            if not self.is_agg_query:
+                rows = [row for part in self._filings.values() for row in part]
+            else:
+                rows = []
+                for group_key, group in self._groups.items():
+                    if group_key not in self._rows:
+                        self._rows[group_key] = self._finalize(group)
+                    if self._rows[group_key] is not None:
+                        rows.append(self._rows[group_key])
+            header_values = list(self.header_values)
+        column_values = [list(column) for column in zip(*rows)] if rows else [[] for _ in self.select_exprs]
+        return QExecutor._format_output(column_values, header_values, output_format or self.output_format)
+
+
+class MaterializedQueries(object):
+    """A set of named materialized queries kept up to date with the same filings.
+
+    Queries only include the filings added after they are registered.
+    """
+
+    def __init__(self):
+        self.queries = collections.OrderedDict()
+
+    def register(self, name, query_spec):
+        query = self.queries[name] = MaterializedQuery(query_spec)
+        return query
+
+    def unregister(self, name):
+        del self.queries[name]
+
+    def add_filing(self, filing_id, evaluator: ExprEvaluator):
+        for query in self.queries.values():
+            query.add_filing(filing_id, evaluator)
+
+    def remove_filing(self, filing_id):
+        for query in self.queries.values():
+            if filing_id in query.filing_ids:
+                query.remove_filing(filing_id)
+
+    def result(self, name, output_format=None):
+        return self.queries[name].result(output_format)
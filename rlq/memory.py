@@ -0,0 +1,106 @@
+"""Per-query memory accounting with tracemalloc.
+
+Pass a MemoryTracker to QExecutor.query() to record the peak memory allocated in each
+stage of the query, and optionally to abort the query with MemoryLimitExceeded once it
+allocates more than max_bytes:
+
+    tracker = MemoryTracker(max_bytes=512 << 20)
+    try:
+        executor.query(query_spec, memory_tracker=tracker)
+    finally:
+        print(tracker.peaks)
+
+tracemalloc traces every allocation of the process, so queries run several times slower
+while any tracker is active, and the allocations of other threads count towards the
+query. Its peak is process-wide too, so only one tracker is active at a time: a query
+started with a tracker waits for the query of the active one to finish. It is meant for
+workers that run one query at a time, or for finding the queries that need a budget.
+"""
+import collections
+import threading
+import tracemalloc
+
+from rlq.errors import MemoryLimitExceeded
+
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+
+# Held by the active tracker, from the start to the end of its query
+_active_lock = threading.Lock()
+
+
+def _start_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        if _tracing_users == 0 and tracemalloc.is_tracing():
+            # Tracing was started elsewhere, which is responsible for stopping it
+            return False
+        if _tracing_users == 0:
+            tracemalloc.start()
+        _tracing_users += 1
+    return True
+
+
+def _stop_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0:
+            tracemalloc.stop()
+
+
+class MemoryTracker(object):
+    """Records the peak memory allocated by each stage of a query, in bytes above the
+    memory in use when the query started, and enforces max_bytes if given.
+
+    The budget is checked periodically inside the loops of each stage, so a query may
+    go somewhat over it before it is aborted. A tracker can be reused for several
+    queries one after another; peaks holds the stages of the last one. Only one tracker
+    is active at a time (see the module docstring).
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.peaks = collections.OrderedDict()
+        self._owns_tracing = False
+        self._baseline = 0
+        self._stage = None
+
+    @property
+    def peak(self):
+        return max(self.peaks.values(), default=0)
+
+    def start(self, stats):
+        _active_lock.acquire()
+        self._owns_tracing = _start_tracing()
+        self.peaks = collections.OrderedDict()
+        self._baseline = tracemalloc.get_traced_memory()[0]
+        self._stage = None
+        tracemalloc.reset_peak()
+
+    def stage(self, name, stats):
+        self._end_stage()
+        self._stage = name
+        tracemalloc.reset_peak()
+
+    def check(self, stats):
+        used = tracemalloc.get_traced_memory()[1] - self._baseline
+        if self.max_bytes is not None and used > self.max_bytes:
+            self._end_stage()
+            raise MemoryLimitExceeded(
+                'Query allocated {} bytes in stage {}, over the limit of {} bytes'.format(
+                    used, self._stage, self.max_bytes),
+                stats, limit=self.max_bytes, used=used)
+
+    def stop(self, stats):
+        self._end_stage()
+        self._stage = None
+        if self._owns_tracing:
+            _stop_tracing()
+            self._owns_tracing = False
+        _active_lock.release()
+
+    def _end_stage(self):
+        if self._stage is not None:
+            peak = tracemalloc.get_traced_memory()[1] - self._baseline
+            self.peaks[self._stage] = max(peak, self.peaks.get(self._stage, 0))
@@ -0,0 +1,68 @@
+import collections
+import concurrent.futures
+
+from rlq.utils import get_query_executor
+
+
+def _loaded_size(future):
+    if future.done() and not future.cancelled() and future.exception() is None:
+        return future.result().evaluator.estimated_size()
+    return 0
+
+
+def prefetch(file_paths, depth=2, max_bytes=None, loader=get_query_executor, executor=None, close=True):
+    """Iterate over (file_path, QExecutor) pairs while the next filings load in the background.
+
+    Up to depth filings are loaded ahead of the one being queried by the caller. When
+    max_bytes is given, no new load is started while the filing being queried and the
+    loaded filings waiting to be queried take up more than max_bytes (as estimated by
+    their evaluators), although the next filing is always loaded once nothing is waiting.
+
+    Loads run in executor, or in a thread pool of depth workers owned by the iterator.
+    Each filing is closed when the caller moves on to the next one unless close is False.
+    """
+    own_executor = executor is None
+    if own_executor:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=depth)
+    paths = iter(file_paths)
+    pending = collections.deque()
+    current = None
+
+    def fill():
+        while len(pending) < depth:
+            if pending and max_bytes is not None:
+                held_bytes = sum(_loaded_size(future) for _, future in pending)
+                if current is not None:
+                    held_bytes += current.evaluator.estimated_size()
+                if held_bytes >= max_bytes:
+                    break
+            try:
+                file_path = next(paths)
+            except StopIteration:
+                break
+            pending.append((file_path, executor.submit(loader, file_path)))
+
+    try:
+        fill()
+        while pending:
+            file_path, future = pending.popleft()
+            current = future.result()
+            fill()
+            try:
+                yield file_path, current
+            finally:
+                if close:
+                    current.evaluator.close()
+                current = None
+            fill()
+    finally:
+        for _, future in pending:
+            if not future.cancel() and close:
+                future.add_done_callback(_close_loaded)
+        if own_executor:
+            executor.shutdown(wait=False)
+
+
+def _close_loaded(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().evaluator.close()
@@ -0,0 +1,139 @@
+import collections
+import contextlib
+import hashlib
+import threading
+
+from rlq.utils import get_query_executor
+
+
+def file_hash(file_path, chunk_size=1 << 20):
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class _Entry(object):
+    __slots__ = ('executor', 'size', 'leases')
+
+    def __init__(self, executor, size):
+        self.executor = executor
+        self.size = size
+        self.leases = 0
+
+
+class InstancePool(object):
+    """Hands out QExecutors for XBRL instances and reuses the loaded instances.
+
+    Instances are keyed by file path, or by the hash of the file contents when key='hash'
+    so that copies of a filing share one instance. Each loaded instance is tracked with
+    the approximate memory footprint reported by its evaluator, and when the total goes
+    over max_bytes the least recently used instances are closed.
+
+    get() returns an executor without pinning it, so it may be closed by a later call that
+    evicts it. Use lease() to keep an instance loaded while it is in use, e.g. when the
+    pool is shared between threads.
+    """
+
+    def __init__(self, max_bytes=2 << 30, key='path', loader=get_query_executor):
+        if key not in ('path', 'hash'):
+            raise ValueError('key must be either path or hash')
+        self.max_bytes = max_bytes
+        self.key = key
+        self.loader = loader
+        self.total_bytes = 0
+        self.stats = collections.Counter()
+        self._entries = collections.OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, file_path):
+        return self._key(file_path) in self._entries
+
+    def _key(self, file_path):
+        return file_hash(file_path) if self.key == 'hash' else file_path
+
+    def _acquire(self, file_path, lease):
+        key = self._key(file_path)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    entry.leases += lease
+                    return key, entry
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    break
+            # Another thread is loading the same instance
+            loading.wait()
+
+        try:
+            executor = self.loader(file_path)
+            entry = _Entry(executor, executor.evaluator.estimated_size())
+        except BaseException:
+            # Let a waiting thread try to load it again
+            with self._lock:
+                del self._loading[key]
+                loading.set()
+            raise
+        with self._lock:
+            # The entry is published before the waiting threads are woken up, so that they
+            # find it instead of loading the instance again
+            self.stats['misses'] += 1
+            entry.leases += lease
+            self._entries[key] = entry
+            self.total_bytes += entry.size
+            del self._loading[key]
+            loading.set()
+            evicted = self._evict(keep=key)
+        for evicted_entry in evicted:
+            evicted_entry.executor.evaluator.close()
+        return key, entry
+
+    def _evict(self, keep):
+        evicted = []
+        for key in list(self._entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            entry = self._entries[key]
+            if key == keep or entry.leases:
+                continue
+            del self._entries[key]
+            self.total_bytes -= entry.size
+            self.stats['evictions'] += 1
+            evicted.append(entry)
+        return evicted
+
+    def get(self, file_path):
+        return self._acquire(file_path, lease=0)[1].executor
+
+    @contextlib.contextmanager
+    def lease(self, file_path):
+        key, entry = self._acquire(file_path, lease=1)
+        try:
+            yield entry.executor
+        finally:
+            with self._lock:
+                entry.leases -= 1
+                evicted = self._evict(keep=None)
+            for evicted_entry in evicted:
+                evicted_entry.executor.evaluator.close()
+
+    def clear(self):
+        """Close all the instances that are not leased."""
+        with self._lock:
+            evicted = []
+            for key, entry in list(self._entries.items()):
+                if not entry.leases:
+                    del self._entries[key]
+                    self.total_bytes -= entry.size
+                    evicted.append(entry)
+        for entry in evicted:
+            entry.executor.evaluator.close()
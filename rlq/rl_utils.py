@@ -1,46 +1,141 @@
 import fractions
 import os
 
-from arelle import PackageManager
-from arelle.Cntlr import Cntlr
 from arelle.ModelDtsObject import ModelConcept
 from arelle.ModelInstanceObject import ModelFact
-from arelle.ModelManager import ModelManager
 from arelle.ModelValue import dateTime
-from arelle.ValidateXbrlCalcs import roundValue
-from arelle.ValidateXbrlDimensions import loadDimensionDefaults
 
+# Arelle's controller, loader and validation modules are imported by the functions that
+# use them, as importing them takes far longer than querying an already loaded model.
 
-def parsed_value(fact: ModelFact):
+
+def _round_value(value, precision, decimals):
+    # Replaces itself with Arelle's roundValue() on first use, so that parsing the value
+    # of each numeric fact does not go through an import statement
+    global _round_value
+    from arelle.ValidateXbrlCalcs import roundValue
+    _round_value = roundValue
+    return roundValue(value, precision, decimals)
+
+
+def concept_kind(concept: ModelConcept):
+    """How the values of a concept's facts are parsed by parsed_value()."""
+    if concept is None:
+        return None
+    if concept.isTuple:
+        return 'tuple'
+    if concept.isFraction:
+        return 'fraction'
+    if concept.isInteger:
+        return 'integer'
+    if concept.isNumeric:
+        return 'numeric'
+    if concept.baseXbrliType == 'dateItemType':
+        return 'date'
+    if concept.baseXbrliType == 'booleanItemType':
+        return 'boolean'
+    if concept.isTextBlock:
+        return 'text_block'
+    return 'text'
+
+
+def parsed_value(fact: ModelFact, kind=None):
+    """The value of a fact as a Python object.
+
+    kind is the concept_kind() of the fact's concept if already known, e.g. from a
+    rlq.taxonomy.Taxonomy.
+    """
     if fact is None:
         return None
-    concept = fact.concept  # type: ModelConcept
-    if concept is None or concept.isTuple or fact.isNil:
+    if kind is None:
+        kind = concept_kind(fact.concept)
+    if kind is None or kind == 'tuple' or fact.isNil:
         return None
-    if concept.isFraction:
+    if kind == 'fraction':
         num, den = map(fractions.Fraction, fact.fractionValue)
         return num / den
     val = fact.value.strip()
-    if concept.isInteger:
+    if kind == 'integer':
         return int(val)
-    elif concept.isNumeric:
+    elif kind == 'numeric':
         dec = fact.decimals
         if dec is None or dec == "INF":  # show using decimals or reported format
             dec = len(val.partition(".")[2])
         else:  # max decimals at 28
             dec = max(min(int(dec), 28), -28)  # 2.7 wants short int, 3.2 takes regular int, don't use _INT here
-        num = roundValue(val, fact.precision, dec)  # round using reported decimals
+        num = _round_value(val, fact.precision, dec)  # round using reported decimals
         return num
-    elif concept.baseXbrliType == 'dateItemType':
+    elif kind == 'date':
         return dateTime(val)
-    elif concept.baseXbrliType == 'booleanItemType':
+    elif kind == 'boolean':
         return val.lower() in ('1', 'true')
-    elif concept.isTextBlock:
+    elif kind == 'text_block':
         return ' '.join(val.split())
     return val
 
 
+# Lazily built fact indexes of ModelXbrl that have to be rebuilt after pruning facts
+_MODEL_FACT_INDEXES = ('_factsByQname', '_factsByLocalName', '_factsByDatatype', '_factsByPeriodType',
+                       '_factsByDimQname', '_nonNilFactsInInstance')
+
+
+def _drop_model_object(xbrl_model, model_object):
+    parent = model_object.getparent()
+    if parent is not None:
+        parent.remove(model_object)
+    object_index = getattr(model_object, 'objectIndex', None)
+    if object_index is not None and object_index < len(xbrl_model.modelObjects):
+        xbrl_model.modelObjects[object_index] = None
+
+
+def prune_facts(xbrl_model, qnames):
+    """Drop all the facts whose concept is not in qnames from a loaded model.
+
+    Tuples that contain facts of those concepts, at any depth, are kept with them.
+    Contexts and units that are no longer used by any fact are dropped as well, so
+    anything derived from all the contexts (such as the FYs of the instance) has to be
+    computed first. This is meant to be called right after loading, before any fact
+    index is built.
+    """
+    qnames = set(qnames)
+
+    def prune(facts):
+        kept_facts = []
+        for fact in facts:
+            if fact.qname in qnames:
+                kept_facts.append(fact)
+                continue
+            tuple_facts = getattr(fact, 'modelTupleFacts', None)
+            if tuple_facts:
+                tuple_facts[:] = prune(tuple_facts)
+                if tuple_facts:
+                    kept_facts.append(fact)
+                    continue
+            dropped = [fact]
+            while dropped:
+                dropped_fact = dropped.pop()
+                xbrl_model.factsInInstance.discard(dropped_fact)
+                dropped.extend(getattr(dropped_fact, 'modelTupleFacts', ()))
+            _drop_model_object(xbrl_model, fact)
+        return kept_facts
+
+    xbrl_model.facts[:] = prune(xbrl_model.facts)
+    xbrl_model.undefinedFacts[:] = [f for f in xbrl_model.undefinedFacts if f.qname in qnames]
+    for attr in _MODEL_FACT_INDEXES:
+        if attr in xbrl_model.__dict__:
+            delattr(xbrl_model, attr)
+
+    used_context_ids = {f.contextID for f in xbrl_model.factsInInstance}
+    for context_id in [c for c in xbrl_model.contexts if c not in used_context_ids]:
+        _drop_model_object(xbrl_model, xbrl_model.contexts.pop(context_id))
+    used_unit_ids = {f.unitID for f in xbrl_model.factsInInstance}
+    for unit_id in [u for u in xbrl_model.units if u not in used_unit_ids]:
+        _drop_model_object(xbrl_model, xbrl_model.units.pop(unit_id))
+
+
 def save_taxonomy_config(taxonomies_dir, controller=None):
+    from arelle import PackageManager
+    from arelle.Cntlr import Cntlr
     if controller is None:
         controller = Cntlr(logFileName='logToStdErr')
     PackageManager.init(controller)
@@ -51,7 +146,15 @@ def save_taxonomy_config(taxonomies_dir, controller=None):
     PackageManager.save(controller)
 
 
-def load_xbrl_model(file_path, taxonomies_dir=None):
+def load_xbrl_model(file_path, taxonomies_dir=None, dimension_defaults=True):
+    """Load an instance with Arelle.
+
+    Pass dimension_defaults=False to skip loading the dimension defaults of the
+    taxonomy, e.g. when they are read from a rlq.taxonomy.Taxonomy instead.
+    """
+    from arelle import PackageManager
+    from arelle.Cntlr import Cntlr
+    from arelle.ModelManager import ModelManager
     controller = Cntlr(logFileName='logToStdErr')
     if taxonomies_dir is not None:
         save_taxonomy_config(taxonomies_dir, controller)
@@ -60,5 +163,42 @@ def load_xbrl_model(file_path, taxonomies_dir=None):
     model_manager = ModelManager(controller)
     model_manager.abortOnMajorError = True
     xbrl_model = model_manager.load(file_path)
-    loadDimensionDefaults(xbrl_model)
+    if dimension_defaults:
+        load_dimension_defaults(xbrl_model)
     return xbrl_model
+
+
+def load_dimension_defaults(xbrl_model):
+    from arelle.ValidateXbrlDimensions import loadDimensionDefaults
+    loadDimensionDefaults(xbrl_model)
+
+
+def get_entry_point(xbrl_model):
+    """The taxonomy entry point of an instance: the URLs of the schemas it refers to."""
+    documents = xbrl_model.modelDocument.referencesDocument
+    return ' '.join(sorted(document.uri for document in documents if document.uri.endswith('.xsd')))
+
+
+def build_taxonomy(xbrl_model, entry_point=None, version='', label_roles=(None,)):
+    """A rlq.taxonomy.Taxonomy with the concepts, labels and dimension defaults of a
+    loaded model, which must have its dimension defaults loaded.
+
+    Labels are kept for the given label roles, None being the standard label role.
+    """
+    from rlq.taxonomy import Taxonomy
+    if entry_point is None:
+        entry_point = get_entry_point(xbrl_model)
+    names = {}
+    kinds = {}
+    labels = {}
+    for qn, concept in xbrl_model.qnameConcepts.items():
+        clark_name = qn.clarkNotation
+        names[clark_name] = str(qn)
+        kinds[clark_name] = concept_kind(concept)
+        for label_role in label_roles:
+            label = concept.label(label_role, strip=True)
+            if label is not None:
+                labels[clark_name, label_role or ''] = label
+    dim_defaults = {axis.clarkNotation: member.clarkNotation
+                    for axis, member in xbrl_model.qnameDimensionDefaults.items()}
+    return Taxonomy(entry_point, version, names, kinds, labels, dim_defaults)
@@ -0,0 +1,304 @@
+"""Compact JSON representation of expressions and query specs.
+
+An expression is encoded as a JSON array ``[class_name, arg1, arg2, ...]`` holding its
+constructor arguments in order, with trailing arguments that equal their defaults left out:
+
+    C('in-ca:NameOfCompany')          -> ["ConceptValue", "in-ca:NameOfCompany"]
+    Ax() >= {'in-ca:AuditorsAxis'}    -> ["BinaryExpr", "ge", ["DimAxes"],
+                                          ["Literal", {"$set": ["in-ca:AuditorsAxis"]}]]
+
+Values that JSON cannot represent (sets, tuples, dates, decimals, ...) are wrapped in a
+single-key object such as ``{"$set": [...]}``. A query spec is encoded as a JSON object
+with a ``version`` key and the usual query spec keys.
+"""
+import collections.abc
+import datetime
+import decimal
+import fractions
+import functools
+import inspect
+import json
+
+import rlq.expr
+from rlq.expr import _op
+from rlq.expr.base import BaseExpr
+
+VERSION = 1
+
+_EXPR_KEYS = ('pivot',)
+_EXPR_LIST_KEYS = ('where', 'context_groupby', 'groupby', 'rollup', 'having', 'order_by', 'pivot_values')
+_EXPR_LISTS_KEYS = ('grouping_sets',)
+_VALUE_KEYS = ('pivot_columns',)
+_PLAIN_KEYS = ('output_format', 'header_display', 'limit', 'offset')
+
+
+def _expr_classes():
+    try:
+        return _expr_classes.cache
+    except AttributeError:
+        classes = {}
+        pending = [BaseExpr]
+        while pending:
+            cls = pending.pop()
+            if cls.__module__.startswith(rlq.expr.__name__) and not cls.__name__.startswith('_'):
+                classes[cls.__name__] = cls
+            pending.extend(cls.__subclasses__())
+        _expr_classes.cache = classes
+        return classes
+
+
+def _defaults(cls):
+    params = list(inspect.signature(cls.__init__).parameters.values())[1:]
+    return [p.default for p in params]
+
+
+def _is_default(value, default):
+    if default is inspect.Parameter.empty or isinstance(value, BaseExpr) or isinstance(default, BaseExpr):
+        return False
+    return type(value) is type(default) and value == default
+
+
+def _sort_key(encoded):
+    return json.dumps(encoded, sort_keys=True)
+
+
+def encode_value(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    elif isinstance(value, list):
+        return [encode_value(v) for v in value]
+    elif isinstance(value, tuple):
+        return {'$tuple': [encode_value(v) for v in value]}
+    elif isinstance(value, (set, frozenset)):
+        tag = '$set' if isinstance(value, set) else '$frozenset'
+        return {tag: sorted((encode_value(v) for v in value), key=_sort_key)}
+    elif isinstance(value, dict):
+        return {'$dict': [[encode_value(k), encode_value(v)] for k, v in value.items()]}
+    elif isinstance(value, datetime.datetime):
+        return {'$datetime': value.isoformat()}
+    elif isinstance(value, datetime.date):
+        return {'$date': value.isoformat()}
+    elif isinstance(value, decimal.Decimal):
+        return {'$decimal': str(value)}
+    elif isinstance(value, fractions.Fraction):
+        return {'$fraction': str(value)}
+    raise ValueError('Cannot serialize value of type {}: {!r}'.format(type(value).__name__, value))
+
+
+def decode_value(data):
+    if isinstance(data, list):
+        return [decode_value(v) for v in data]
+    elif not isinstance(data, dict):
+        return data
+    if len(data) != 1:
+        raise ValueError('Invalid encoded value: {!r}'.format(data))
+    (tag, payload), = data.items()
+    if tag == '$tuple':
+        return tuple(decode_value(v) for v in payload)
+    elif tag == '$set':
+        return {decode_value(v) for v in payload}
+    elif tag == '$frozenset':
+        return frozenset(decode_value(v) for v in payload)
+    elif tag == '$dict':
+        return {decode_value(k): decode_value(v) for k, v in payload}
+    elif tag == '$datetime':
+        return datetime.datetime.fromisoformat(payload)
+    elif tag == '$date':
+        return datetime.date.fromisoformat(payload)
+    elif tag == '$decimal':
+        return decimal.Decimal(payload)
+    elif tag == '$fraction':
+        return fractions.Fraction(payload)
+    raise ValueError('Unknown value tag {}'.format(tag))
+
+
+def encode_expr(expr: BaseExpr):
+    cls = type(expr)
+    if _expr_classes().get(cls.__name__) is not cls:
+        raise ValueError('Cannot serialize expression of type {}'.format(cls.__name__))
+    args = []
+    for attr, kind in cls.FIELDS:
+        value = getattr(expr, attr)
+        if kind == 'expr':
+            args.append(encode_expr(value))
+        elif kind in ('exprs', 'expr_list'):
+            args.append([encode_expr(e) for e in value])
+        elif kind == 'op':
+            args.append(value.__name__)
+        else:
+            args.append(encode_value(value))
+
+    # Leave out trailing arguments that are the same as the constructor defaults
+    if not any(kind == 'exprs' for _, kind in cls.FIELDS):
+        defaults = _defaults(cls)
+        while args and _is_default(getattr(expr, cls.FIELDS[len(args) - 1][0]), defaults[len(args) - 1]):
+            args.pop()
+    return [cls.__name__] + args
+
+
+def decode_expr(data) -> BaseExpr:
+    if not isinstance(data, list) or not data or not isinstance(data[0], str):
+        raise ValueError('Invalid encoded expression: {!r}'.format(data))
+    cls = _expr_classes().get(data[0])
+    if cls is None:
+        raise ValueError('Unknown expression type {}'.format(data[0]))
+    if len(data) - 1 > len(cls.FIELDS):
+        raise ValueError('Too many arguments for {}: {!r}'.format(data[0], data))
+    args = []
+    kwargs = {}
+    variadic = False
+    for (attr, kind), arg in zip(cls.FIELDS, data[1:]):
+        if kind == 'expr':
+            value = decode_expr(arg)
+        elif kind == 'exprs':
+            args.extend(decode_expr(e) for e in arg)
+            variadic = True
+            continue
+        elif kind == 'expr_list':
+            value = [decode_expr(e) for e in arg]
+        elif kind == 'op':
+            value = getattr(_op, arg, None) if not arg.startswith('_') else None
+            if not callable(value):
+                raise ValueError('Unknown operator {}'.format(arg))
+        else:
+            value = decode_value(arg)
+        if variadic:
+            kwargs[attr] = value
+        else:
+            args.append(value)
+    return cls(*args, **kwargs)
+
+
+def _encode_header(header):
+    return encode_expr(header) if isinstance(header, BaseExpr) else header
+
+
+def _decode_header(data):
+    return decode_expr(data) if isinstance(data, list) else data
+
+
+def _encode_select(select):
+    if isinstance(select, collections.abc.Mapping):
+        return {header: encode_expr(expr) for header, expr in select.items()}
+    encoded = []
+    for expr_spec in select:
+        if isinstance(expr_spec, BaseExpr):
+            encoded.append(encode_expr(expr_spec))
+        else:
+            header, expr = expr_spec
+            encoded.append({'header': _encode_header(header), 'expr': encode_expr(expr)})
+    return encoded
+
+
+def _decode_select(data):
+    if isinstance(data, dict):
+        return {header: decode_expr(expr) for header, expr in data.items()}
+    select = []
+    for item in data:
+        if isinstance(item, dict):
+            select.append((_decode_header(item['header']), decode_expr(item['expr'])))
+        else:
+            select.append(decode_expr(item))
+    return select
+
+
+def _encode_join(join):
+    data = {}
+    for key, value in join.items():
+        if key in ('left', 'right'):
+            data[key] = {k: list(v) if k == 'concepts' else [encode_expr(e) for e in v] for k, v in value.items()}
+        elif key == 'on':
+            data[key] = [{'left': encode_expr(k[0]), 'right': encode_expr(k[1])} if isinstance(k, (tuple, list))
+                         else encode_expr(k) for k in value]
+        elif key == 'how':
+            data[key] = value
+        else:
+            raise ValueError('Cannot serialize join key {}'.format(key))
+    return data
+
+
+def _decode_join(data):
+    join = {}
+    for key, value in data.items():
+        if key in ('left', 'right'):
+            join[key] = {k: list(v) if k == 'concepts' else [decode_expr(e) for e in v] for k, v in value.items()}
+        elif key == 'on':
+            join[key] = [(decode_expr(k['left']), decode_expr(k['right'])) if isinstance(k, dict)
+                         else decode_expr(k) for k in value]
+        elif key == 'how':
+            join[key] = value
+        else:
+            raise ValueError('Unknown join key {}'.format(key))
+    return join
+
+
+def encode_query_spec(query_spec):
+    data = {'version': VERSION}
+    for key, value in query_spec.items():
+        if key == 'select':
+            data[key] = _encode_select(value)
+        elif key == 'headers':
+            data[key] = [_encode_header(h) for h in value]
+        elif key == 'join':
+            data[key] = _encode_join(value)
+        elif key in _EXPR_KEYS:
+            data[key] = encode_expr(value)
+        elif key in _EXPR_LIST_KEYS:
+            data[key] = [encode_expr(e) for e in value]
+        elif key in _EXPR_LISTS_KEYS:
+            data[key] = [[encode_expr(e) for e in exprs] for exprs in value]
+        elif key in _VALUE_KEYS:
+            data[key] = encode_value(value)
+        elif key in _PLAIN_KEYS:
+            data[key] = value
+        else:
+            raise ValueError('Cannot serialize query spec key {}'.format(key))
+    return data
+
+
+def decode_query_spec(data):
+    if data.get('version') != VERSION:
+        raise ValueError('Unsupported query spec version {!r}'.format(data.get('version')))
+    query_spec = {}
+    for key, value in data.items():
+        if key == 'version':
+            continue
+        elif key == 'select':
+            query_spec[key] = _decode_select(value)
+        elif key == 'headers':
+            query_spec[key] = [_decode_header(h) for h in value]
+        elif key == 'join':
+            query_spec[key] = _decode_join(value)
+        elif key in _EXPR_KEYS:
+            query_spec[key] = decode_expr(value)
+        elif key in _EXPR_LIST_KEYS:
+            query_spec[key] = [decode_expr(e) for e in value]
+        elif key in _EXPR_LISTS_KEYS:
+            query_spec[key] = [[decode_expr(e) for e in exprs] for exprs in value]
+        elif key in _VALUE_KEYS:
+            query_spec[key] = decode_value(value)
+        elif key in _PLAIN_KEYS:
+            query_spec[key] = value
+        else:
+            raise ValueError('Unknown query spec key {}'.format(key))
+    return query_spec
+
+
+def dumps(query_spec) -> str:
+    """Serialize a query spec to a compact JSON string."""
+    return json.dumps(encode_query_spec(query_spec), separators=(',', ':'))
+
+
+@functools.lru_cache(maxsize=1024)
+def _loads(s):
+    return decode_query_spec(json.loads(s))
+
+
+def loads(s: str):
+    """Parse a query spec serialized with dumps().
+
+    Parsed specs are cached by source string, so repeatedly loading the same query only
+    builds its expressions once. The expressions are shared between callers and must not
+    be modified.
+    """
+    return dict(_loads(s))
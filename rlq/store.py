@@ -0,0 +1,303 @@
+"""Fact store spanning many filings of the same entities.
+
+Facts are copied out of each filing into small records, so the filings can be closed once
+they are added. Every fact is indexed by entity identifier, concept name and context
+signature (dimensions and period), and when several filings report a fact for the same
+key the one from the newest filing is used. This way comparatives repeated in later
+filings collapse into one fact and restated figures override the originally reported ones.
+"""
+import collections
+import threading
+
+from rlq.evaluators.base import ExprEvaluator
+from rlq.executor import QExecutor
+
+
+class StoredContext(object):
+    __slots__ = ('id', 'entity', 'dims', 'period', 'start_datetime', 'end_datetime', 'end_date', 'fy')
+
+    def __init__(self, entity, dims, period, start_datetime, end_datetime, end_date, fy):
+        self.entity = entity
+        # axis name -> (member name, member label, member value)
+        self.dims = dims
+        self.period = period
+        self.start_datetime = start_datetime
+        self.end_datetime = end_datetime
+        self.end_date = end_date
+        self.fy = fy
+        self.id = (entity, frozenset((axis, member[2]) for axis, member in dims.items()), period)
+
+
+class StoredFact(object):
+    __slots__ = ('concept_name', 'value', 'context', 'filing_id', 'filing_date', 'seq')
+
+    def __init__(self, concept_name, value, context, filing_id, filing_date, seq):
+        self.concept_name = concept_name
+        self.value = value
+        self.context = context
+        self.filing_id = filing_id
+        self.filing_date = filing_date
+        self.seq = seq
+
+    @property
+    def version(self):
+        return self.filing_date, self.seq
+
+    def __repr__(self):
+        return '{}({}, {!r}, filing={})'.format(type(self).__name__, self.concept_name, self.value, self.filing_id)
+
+
+class EntityFactStore(object):
+    def __init__(self):
+        # entity -> concept name -> context id -> versions of the fact ordered by filing
+        self._facts = collections.defaultdict(lambda: collections.defaultdict(dict))
+        self._filings = {}
+        self._seq = 0
+        self.concept_labels = {}
+        self.dim_defaults = {}
+        # entity -> FYs of its facts, newest first; cleared when filings are added or removed
+        self._fys = {}
+        self._lock = threading.RLock()
+
+    @property
+    def entities(self):
+        return list(self._facts)
+
+    def _entities(self, entity):
+        if entity is None:
+            return list(self._facts)
+        elif isinstance(entity, str):
+            # Bare identifier without the scheme
+            return [e for e in self._facts if e is not None and e[1] == entity]
+        return [entity]
+
+    @property
+    def filings(self):
+        return dict(self._filings)
+
+    def add_filing(self, evaluator: ExprEvaluator, filing_id=None, filing_date=None):
+        """Copy all the facts of a filing into the store.
+
+        filing_date decides which filing wins when several report the same fact and
+        defaults to the latest period end date in the filing. Adding a filing_id that is
+        already in the store replaces that filing.
+        """
+        with self._lock:
+            self._seq += 1
+            self._fys.clear()
+            seq = self._seq
+            if filing_id is None:
+                filing_id = seq
+            if filing_id in self._filings:
+                self.remove_filing(filing_id)
+
+            facts = [f for f in evaluator.get_facts() if evaluator.get_concept_name(f, None) is not None]
+            if filing_date is None:
+                end_dates = [evaluator.get_end_date(f) for f in facts]
+                filing_date = max((d for d in end_dates if d is not None), default=None)
+
+            stored_facts = []
+            contexts = {}
+            axes = set()
+            for fact in facts:
+                context = self._stored_context(evaluator, fact, contexts)
+                axes.update(context.dims)
+                concept_name = evaluator.get_concept_name(fact, None)
+                stored_facts.append(StoredFact(concept_name, evaluator.get_concept_value(fact, None),
+                                               context, filing_id, filing_date, seq))
+                if concept_name not in self.concept_labels:
+                    self.concept_labels[concept_name] = evaluator.get_concept_label(fact, None, None)
+            self._add_dim_defaults(evaluator, facts, axes)
+
+            for stored_fact in stored_facts:
+                versions = self._facts[stored_fact.context.entity][stored_fact.concept_name].setdefault(
+                    stored_fact.context.id, [])
+                versions.append(stored_fact)
+                versions.sort(key=lambda f: f.version)
+            self._filings[filing_id] = (filing_date, stored_facts)
+            return filing_id
+
+    def _stored_context(self, evaluator, fact, contexts):
+        dims = {}
+        for axis in evaluator.get_dim_axes(fact) or ():
+            dims[axis] = (evaluator.get_dim_member_name(fact, axis, False),
+                          evaluator.get_dim_member_label(fact, axis, False),
+                          evaluator.get_dim_member_value(fact, axis, False))
+        context = StoredContext(evaluator.get_entity_identifier(fact), dims, evaluator.get_period(fact),
+                                evaluator.get_start_datetime(fact), evaluator.get_end_datetime(fact),
+                                evaluator.get_end_date(fact), evaluator.get_fy(fact))
+        # Share one context object between the facts of a filing
+        return contexts.setdefault(context.id, context)
+
+    def _add_dim_defaults(self, evaluator, facts, axes):
+        for axis in axes - set(self.dim_defaults):
+            fact = next((f for f in facts if axis not in evaluator.get_dim_axes(f)), None)
+            if fact is not None:
+                self.dim_defaults[axis] = (evaluator.get_dim_member_name(fact, axis, True),
+                                           evaluator.get_dim_member_label(fact, axis, True),
+                                           evaluator.get_dim_member_value(fact, axis, True))
+            if axis not in self.concept_labels:
+                self.concept_labels[axis] = evaluator.get_concept_label(None, axis, None)
+
+    def add_taxonomy(self, taxonomy):
+        """Seed the concept labels and dimension defaults from an rlq.taxonomy.Taxonomy.
+
+        Labels and defaults already in the store, e.g. from added filings, are kept.
+        """
+        with self._lock:
+            for clark_name, name in taxonomy.names.items():
+                label = taxonomy.label(clark_name)
+                if label is not None:
+                    self.concept_labels.setdefault(name, label)
+            for axis, member in taxonomy.dim_defaults.items():
+                member_name = taxonomy.names.get(member)
+                if member_name is not None and axis in taxonomy.names:
+                    self.dim_defaults.setdefault(taxonomy.names[axis],
+                                                 (member_name, taxonomy.label(member), member_name))
+
+    def remove_filing(self, filing_id):
+        with self._lock:
+            _, stored_facts = self._filings.pop(filing_id)
+            self._fys.clear()
+            for stored_fact in stored_facts:
+                concept_facts = self._facts[stored_fact.context.entity][stored_fact.concept_name]
+                versions = concept_facts[stored_fact.context.id]
+                versions.remove(stored_fact)
+                if not versions:
+                    del concept_facts[stored_fact.context.id]
+
+    def get_facts(self, entity=None, concept_name=None):
+        """The newest version of every fact of an entity (or of all entities).
+
+        entity is an identifier as returned by get_entity_identifier(), i.e. a
+        (scheme, identifier) pair, or just the identifier.
+        """
+        with self._lock:
+            facts = set()
+            for entity_ in self._entities(entity):
+                concept_facts = self._facts.get(entity_, {})
+                concept_names = [concept_name] if concept_name is not None else list(concept_facts)
+                for name in concept_names:
+                    facts.update(versions[-1] for versions in concept_facts.get(name, {}).values())
+            return facts
+
+    def fys(self, entity=None):
+        """The FYs of the facts of an entity (or of all entities), newest first."""
+        with self._lock:
+            fys = self._fys.get(entity)
+            if fys is None:
+                fys = self._fys[entity] = sorted({f.context.fy for f in self.get_facts(entity)} - {None},
+                                                 reverse=True)
+            return fys
+
+    def query_executor(self, entity=None):
+        return QExecutor(StoreExprEvaluator(self, entity))
+
+
+class StoreExprEvaluator(ExprEvaluator):
+    """ExprEvaluator over the facts of one entity (or all entities) in an EntityFactStore.
+
+    Concepts are referred to by their prefixed names as reported in the filings. Only
+    standard role labels are kept in the store, so all label roles return those.
+    """
+
+    def __init__(self, store: EntityFactStore, entity=None):
+        self.store = store
+        self.entity = entity
+
+    def _name(self, name):
+        if name is None or ':' in name:
+            return name
+        matches = [n for n in self.store.concept_labels if n.rpartition(':')[2] == name]
+        if len(matches) > 1:
+            raise ValueError('Multiple concepts for local name {}: {}'.format(name, matches))
+        return matches[0] if matches else name
+
+    def get_facts(self, concept_name=None):
+        return self.store.get_facts(self.entity, self._name(concept_name))
+
+    def get_year(self, year):
+        if year <= 0:
+            return self.store.fys(self.entity)[-year]
+        return year
+
+    def get_concept(self, fact, name):
+        return self.get_concept_name(fact, name)
+
+    def get_concept_name(self, fact, name):
+        if fact is not None:
+            return fact.concept_name
+        elif name is not None:
+            return self._name(name)
+        raise ValueError('Both fact and name cannot be None')
+
+    def get_concept_label(self, fact, name, label_role=None):
+        return self.store.concept_labels.get(self.get_concept_name(fact, name))
+
+    def get_concept_value(self, fact, default):
+        return fact.value if fact is not None and fact.value is not None else default
+
+    def _dim_member(self, fact, axis_name, include_defaults):
+        if fact is None:
+            return None
+        member = fact.context.dims.get(axis_name)
+        if member is None and include_defaults:
+            member = self.store.dim_defaults.get(axis_name)
+        return member
+
+    def get_dim_member(self, fact, axis_name, include_defaults=True):
+        return self.get_dim_member_name(fact, axis_name, include_defaults)
+
+    def get_dim_member_name(self, fact, axis_name, include_defaults=True):
+        member = self._dim_member(fact, axis_name, include_defaults)
+        return member[0] if member is not None else None
+
+    def get_dim_member_label(self, fact, axis_name, include_defaults=True, label_role=None):
+        member = self._dim_member(fact, axis_name, include_defaults)
+        return member[1] if member is not None else None
+
+    def get_dim_member_value(self, fact, axis_name, include_defaults=True, label_role=None):
+        member = self._dim_member(fact, axis_name, include_defaults)
+        return member[2] if member is not None else None
+
+    def get_dim_axes(self, fact):
+        return frozenset(fact.context.dims) if fact is not None else None
+
+    def get_period(self, fact, forever_dt=None):
+        if fact is None:
+            return None
+        return fact.context.period if fact.context.period is not None else forever_dt
+
+    def get_period_str(self, fact, instant_format, duration_format, forever_format):
+        if fact is None:
+            return ''
+        period = fact.context.period
+        if isinstance(period, tuple):
+            return duration_format.format(*period)
+        elif period is not None:
+            return instant_format.format(period)
+        return forever_format
+
+    def get_start_datetime(self, fact):
+        return fact.context.start_datetime if fact is not None else None
+
+    def get_end_datetime(self, fact):
+        return fact.context.end_datetime if fact is not None else None
+
+    def get_end_date(self, fact):
+        return fact.context.end_date if fact is not None else None
+
+    def get_fy(self, fact):
+        return fact.context.fy if fact is not None else None
+
+    def get_context_id(self, fact):
+        return fact.context.id
+
+    def get_context_hash_no_period_type(self, fact):
+        if fact is None:
+            return hash(None)
+        context = fact.context
+        return hash((context.entity, context.id[1], context.end_datetime))
+
+    def get_entity_identifier(self, fact):
+        return fact.context.entity if fact is not None else None
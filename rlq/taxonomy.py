@@ -0,0 +1,172 @@
+"""On-disk catalog of the concept metadata, labels and dimension defaults of taxonomies.
+
+The concept types, labels and dimension defaults that evaluators look up are the same
+for every filing that uses a given taxonomy version, but Arelle rebuilds them from the
+DTS for each filing. A TaxonomyCatalog stores them once per taxonomy entry point and
+version in an SQLite file, which is memory-mapped when read, and hands out one shared
+in-memory Taxonomy per entry point and version to every evaluator of the process:
+
+    catalog = TaxonomyCatalog('taxonomies.sqlite')
+    evaluator = RLExprEvaluator.load(file_path, catalog=catalog)
+
+The first filing of a taxonomy version adds it to the catalog. Concepts are identified
+by their Clark notation names ('{namespace}localName'), since prefixes can differ
+between filings.
+"""
+import contextlib
+import os
+import sqlite3
+import threading
+
+# Bytes of the catalog file that SQLite reads through a memory map instead of read calls
+MMAP_SIZE = 256 << 20
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS taxonomies (id INTEGER PRIMARY KEY, entry_point TEXT NOT NULL, '
+    'version TEXT NOT NULL, UNIQUE (entry_point, version))',
+    'CREATE TABLE IF NOT EXISTS concepts (taxonomy_id INTEGER NOT NULL, clark_name TEXT NOT NULL, '
+    'name TEXT NOT NULL, kind TEXT, PRIMARY KEY (taxonomy_id, clark_name)) WITHOUT ROWID',
+    'CREATE TABLE IF NOT EXISTS labels (taxonomy_id INTEGER NOT NULL, clark_name TEXT NOT NULL, '
+    'role TEXT NOT NULL, label TEXT NOT NULL, PRIMARY KEY (taxonomy_id, clark_name, role)) WITHOUT ROWID',
+    'CREATE TABLE IF NOT EXISTS dim_defaults (taxonomy_id INTEGER NOT NULL, axis TEXT NOT NULL, '
+    'member TEXT NOT NULL, PRIMARY KEY (taxonomy_id, axis)) WITHOUT ROWID',
+)
+_TABLES = ('concepts', 'labels', 'dim_defaults')
+
+
+def split_clark_name(clark_name):
+    """(namespace, local name) of a Clark notation name."""
+    if clark_name.startswith('{'):
+        namespace, _, local_name = clark_name[1:].partition('}')
+        return namespace, local_name
+    return None, clark_name
+
+
+class Taxonomy(object):
+    """Concept metadata, labels and dimension defaults of one taxonomy version.
+
+    names maps the Clark notation name of each concept to its prefixed name, kinds to
+    its value kind (see rl_utils.concept_kind()), labels maps (Clark notation name, label
+    role) to a label, with '' for the standard label role, and dim_defaults maps the
+    Clark notation name of each axis to that of its default member.
+    """
+
+    def __init__(self, entry_point, version='', names=None, kinds=None, labels=None, dim_defaults=None):
+        self.entry_point = entry_point
+        self.version = version
+        self.names = names or {}
+        self.kinds = kinds or {}
+        self.labels = labels or {}
+        self.dim_defaults = dim_defaults or {}
+
+    def label(self, clark_name, label_role=None):
+        return self.labels.get((clark_name, label_role or ''))
+
+    def __repr__(self):
+        return '{}({!r}, {!r}, concepts={})'.format(type(self).__name__, self.entry_point, self.version,
+                                                    len(self.names))
+
+
+class TaxonomyCatalog(object):
+    """Taxonomies stored in an SQLite file, keyed by entry point and version.
+
+    Several processes can share a catalog file. Each taxonomy is read from the file at
+    most once per catalog object and then served from memory.
+    """
+
+    def __init__(self, path, mmap_size=MMAP_SIZE):
+        self.path = os.fspath(path)
+        self.mmap_size = mmap_size
+        self._taxonomies = {}
+        self._lock = threading.Lock()
+        with self._connect() as connection, connection:
+            for statement in _SCHEMA:
+                connection.execute(statement)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute('PRAGMA mmap_size = {:d}'.format(self.mmap_size))
+        return contextlib.closing(connection)
+
+    def keys(self):
+        """The (entry point, version) of every taxonomy in the catalog."""
+        with self._connect() as connection:
+            return [tuple(row) for row in connection.execute(
+                'SELECT entry_point, version FROM taxonomies ORDER BY entry_point, version')]
+
+    def __contains__(self, key):
+        return self.get(*key) is not None
+
+    def get(self, entry_point, version=''):
+        """The Taxonomy for an entry point and version, or None if it is not in the catalog."""
+        key = entry_point, version
+        try:
+            return self._taxonomies[key]
+        except KeyError:
+            pass
+        with self._lock:
+            if key not in self._taxonomies:
+                taxonomy = self._read(entry_point, version)
+                if taxonomy is None:
+                    return None
+                self._taxonomies[key] = taxonomy
+            return self._taxonomies[key]
+
+    def _read(self, entry_point, version):
+        with self._connect() as connection:
+            row = connection.execute('SELECT id FROM taxonomies WHERE entry_point = ? AND version = ?',
+                                     (entry_point, version)).fetchone()
+            if row is None:
+                return None
+            taxonomy_id, = row
+            names = {}
+            kinds = {}
+            for clark_name, name, kind in connection.execute(
+                    'SELECT clark_name, name, kind FROM concepts WHERE taxonomy_id = ?', (taxonomy_id,)):
+                names[clark_name] = name
+                kinds[clark_name] = kind
+            labels = {(clark_name, role): label for clark_name, role, label in connection.execute(
+                'SELECT clark_name, role, label FROM labels WHERE taxonomy_id = ?', (taxonomy_id,))}
+            dim_defaults = dict(connection.execute(
+                'SELECT axis, member FROM dim_defaults WHERE taxonomy_id = ?', (taxonomy_id,)))
+        return Taxonomy(entry_point, version, names, kinds, labels, dim_defaults)
+
+    def add(self, taxonomy):
+        """Store a Taxonomy, replacing any stored for the same entry point and version.
+
+        Returns the taxonomy.
+        """
+        with self._lock, self._connect() as connection:
+            with connection:
+                # Replace the rows of the taxonomy in one transaction
+                connection.execute('INSERT OR IGNORE INTO taxonomies (entry_point, version) VALUES (?, ?)',
+                                   (taxonomy.entry_point, taxonomy.version))
+                taxonomy_id, = connection.execute(
+                    'SELECT id FROM taxonomies WHERE entry_point = ? AND version = ?',
+                    (taxonomy.entry_point, taxonomy.version)).fetchone()
+                for table in _TABLES:
+                    connection.execute('DELETE FROM {} WHERE taxonomy_id = ?'.format(table), (taxonomy_id,))
+                connection.executemany(
+                    'INSERT INTO concepts (taxonomy_id, clark_name, name, kind) VALUES (?, ?, ?, ?)',
+                    [(taxonomy_id, clark_name, name, taxonomy.kinds.get(clark_name))
+                     for clark_name, name in taxonomy.names.items()])
+                connection.executemany(
+                    'INSERT INTO labels (taxonomy_id, clark_name, role, label) VALUES (?, ?, ?, ?)',
+                    [(taxonomy_id, clark_name, role, label) for (clark_name, role), label in taxonomy.labels.items()])
+                connection.executemany(
+                    'INSERT INTO dim_defaults (taxonomy_id, axis, member) VALUES (?, ?, ?)',
+                    [(taxonomy_id, axis, member) for axis, member in taxonomy.dim_defaults.items()])
+            self._taxonomies[taxonomy.entry_point, taxonomy.version] = taxonomy
+        return taxonomy
+
+    def remove(self, entry_point, version=''):
+        with self._lock, self._connect() as connection:
+            with connection:
+                row = connection.execute('SELECT id FROM taxonomies WHERE entry_point = ? AND version = ?',
+                                         (entry_point, version)).fetchone()
+                if row is not None:
+                    for table in _TABLES:
+                        connection.execute('DELETE FROM {} WHERE taxonomy_id = ?'.format(table), row)
+                    connection.execute('DELETE FROM taxonomies WHERE id = ?', row)
+            self._taxonomies.pop((entry_point, version), None)
+
@@ -0,0 +1,153 @@
+import bisect
+import collections
+import re
+import threading
+
+from rlq.expr import _op
+
+_TOKEN_RE = re.compile(r'\w+')
+_REGEX_SPECIAL = frozenset('.^$*+?{}[]\\|()')
+_MAX_CACHED_SEARCHES = 256
+# Length of the substrings of the tokens in the n-gram index
+_NGRAM = 3
+
+TEXT_OPS = frozenset(['contains', 'icontains', 'regex', 'iregex'])
+
+
+def _tokens(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _literal_prefix(pattern):
+    # re.match() anchors the pattern at the start of the value, so any literal
+    # characters at the start of the pattern must appear in a matching value.
+    if '|' in pattern:
+        return ''
+    prefix = []
+    for ch in pattern:
+        if ch in _REGEX_SPECIAL:
+            if ch in '*?{' and prefix:
+                prefix.pop()
+            break
+        prefix.append(ch)
+    return ''.join(prefix)
+
+
+def _ngrams(token, n):
+    return {token[i:i + n] for i in range(len(token) - n + 1)}
+
+
+def _with_prefix(sorted_tokens, prefix):
+    i = bisect.bisect_left(sorted_tokens, prefix)
+    while i < len(sorted_tokens) and sorted_tokens[i].startswith(prefix):
+        yield sorted_tokens[i]
+        i += 1
+
+
+class TextIndex(object):
+    """Inverted token index over the string values of a set of facts.
+
+    Searches look up candidate facts through the token postings and confirm them by
+    running the actual predicate on the indexed value, so the results are exactly the
+    facts the predicate matches.
+
+    The tokens themselves are looked up through a sorted list for prefixes, a sorted list
+    of the reversed tokens for suffixes and, for substrings, an index of their n-grams
+    that is built on first use, so a search only visits matching tokens.
+    """
+
+    def __init__(self, fact_values):
+        self.values = {}
+        self.postings = collections.defaultdict(set)
+        for fact, value in fact_values:
+            self.values[fact] = value
+            for token in set(_tokens(value)):
+                self.postings[token].add(fact)
+        self.sorted_tokens = sorted(self.postings)
+        self.sorted_reversed_tokens = sorted(token[::-1] for token in self.postings)
+        self._ngram_tokens = None
+        self._ngram_lock = threading.Lock()
+        self._results = {}
+        self._results_lock = threading.Lock()
+
+    def candidates(self, needle):
+        """Facts whose value may contain needle (ignoring case), or None if the index cannot tell."""
+        tokens = _tokens(needle)
+        if not tokens:
+            return None
+        if len(tokens) == 1:
+            matches = [lambda: self._tokens_containing(tokens[0])]
+        else:
+            # Inner tokens of the needle must be whole tokens of the value while the
+            # first and last ones may be the end and start of longer tokens.
+            matches = [lambda: self._tokens_ending_with(tokens[0])]
+            matches.extend((lambda token=token: [token] if token in self.postings else [])
+                           for token in tokens[1:-1])
+            matches.append(lambda: _with_prefix(self.sorted_tokens, tokens[-1]))
+
+        candidates = None
+        for match in matches:
+            facts = set()
+            for token in match():
+                facts |= self.postings[token]
+            candidates = facts if candidates is None else candidates & facts
+            if not candidates:
+                break
+        return candidates
+
+    def _tokens_ending_with(self, suffix):
+        return [t[::-1] for t in _with_prefix(self.sorted_reversed_tokens, suffix[::-1])]
+
+    def _build_ngram_tokens(self):
+        # Tokens shorter than an n-gram are indexed under themselves
+        ngram_tokens = collections.defaultdict(list)
+        for token in self.postings:
+            for ngram in _ngrams(token, _NGRAM) if len(token) >= _NGRAM else (token,):
+                ngram_tokens[ngram].append(token)
+        return dict(ngram_tokens)
+
+    def _tokens_containing(self, needle):
+        if self._ngram_tokens is None:
+            with self._ngram_lock:
+                if self._ngram_tokens is None:
+                    self._ngram_tokens = self._build_ngram_tokens()
+        ngram_tokens = self._ngram_tokens
+        if len(needle) < _NGRAM:
+            # A shorter needle is part of an n-gram, of which there are a bounded number
+            # however many tokens there are
+            tokens = set()
+            for ngram, tokens_ in ngram_tokens.items():
+                if needle in ngram:
+                    tokens.update(tokens_)
+            return tokens
+        # Tokens that contain all the n-grams of the needle, starting from the rarest
+        tokens = None
+        for ngram in sorted(_ngrams(needle, _NGRAM), key=lambda g: len(ngram_tokens.get(g, ()))):
+            tokens = (set(ngram_tokens.get(ngram, ())) if tokens is None
+                      else tokens.intersection(ngram_tokens.get(ngram, ())))
+            if not tokens:
+                return ()
+        return [t for t in tokens if needle in t]
+
+    def search(self, op_name, pattern):
+        try:
+            return self._results[op_name, pattern]
+        except KeyError:
+            pass
+
+        if op_name in ('contains', 'icontains'):
+            candidates = self.candidates(pattern)
+        elif op_name in ('regex', 'iregex'):
+            candidates = self.candidates(_literal_prefix(pattern))
+        else:
+            raise ValueError('Unsupported text operator {}'.format(op_name))
+        if candidates is None:
+            candidates = self.values.keys()
+        op = getattr(_op, op_name)
+        result = frozenset(f for f in candidates if op(self.values[f], pattern))
+
+        with self._results_lock:
+            if len(self._results) >= _MAX_CACHED_SEARCHES:
+                self._results.clear()
+            self._results[op_name, pattern] = result
+        return result
@@ -1,13 +1,25 @@
-from rlq.executor import QExecutor
+from rlq.executor import QExecutor, get_catalog_concept_names
 
 
-def get_query_executor(file_path=None):
+def get_query_executor(file_path=None, concepts=None, query_specs=None, catalog=None, taxonomy_version=''):
     """Create an instance of QExecutor to run queries on.
 
     Based on provided arguments, an ExprEvaluator instance of the appropriate type
     is created for use by the QExecutor.
+
+    To save memory, only the facts of the given concept names, or of the concepts used
+    by the given query specs, are kept when the instance is loaded.
+
+    catalog is an optional rlq.taxonomy.TaxonomyCatalog to read the taxonomy of the
+    instance from instead of building it from the DTS, under taxonomy_version. Give the
+    version when taxonomy versions share their entry point URLs.
     """
+    if query_specs is not None:
+        catalog_concepts = get_catalog_concept_names(query_specs)
+        if catalog_concepts is not None:
+            concepts = catalog_concepts | set(concepts or ())
     if file_path is not None:
         from rlq.evaluators.rl import RLExprEvaluator
-        evaluator = RLExprEvaluator.load(file_path)
+        evaluator = RLExprEvaluator.load(file_path, concepts=concepts, catalog=catalog,
+                                         taxonomy_version=taxonomy_version)
         return QExecutor(evaluator)
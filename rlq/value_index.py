@@ -0,0 +1,102 @@
+import bisect
+import collections
+import decimal
+import fractions
+import threading
+
+VALUE_OPS = frozenset(['eq', 'ne', 'gt', 'ge', 'lt', 'le', 'in_', 'nin'])
+_RANGE_OPS = frozenset(['gt', 'ge', 'lt', 'le'])
+_CONTAINER_TYPES = (set, frozenset, list, tuple)
+_MAX_CACHED_SEARCHES = 256
+
+
+def _is_number(value):
+    return (isinstance(value, (int, float, decimal.Decimal, fractions.Fraction))
+            and not isinstance(value, bool) and value == value)
+
+
+class ValueIndex(object):
+    """Hash index and sorted numeric index over the values of a set of facts.
+
+    search() returns the facts whose value satisfies a comparison exactly like the
+    comparison operator would (facts with no value never match), or None when the index
+    cannot answer it, e.g. a range comparison over values that are not all numbers.
+    """
+
+    def __init__(self, fact_values):
+        self.facts = set()
+        self.by_value = collections.defaultdict(set)
+        self.hashable = True
+        numbers = []
+        self.sortable = True
+        for fact, value in fact_values:
+            if value is None:
+                continue
+            self.facts.add(fact)
+            if self.hashable:
+                try:
+                    self.by_value[value].add(fact)
+                except TypeError:
+                    self.hashable = False
+            if self.sortable:
+                if _is_number(value):
+                    numbers.append((value, fact))
+                else:
+                    self.sortable = False
+        self.facts = frozenset(self.facts)
+        try:
+            numbers.sort(key=lambda value_fact: value_fact[0])
+        except TypeError:
+            self.sortable = False
+        self.keys = [v for v, _ in numbers] if self.sortable else []
+        self.sorted_facts = [f for _, f in numbers] if self.sortable else []
+        self._results = {}
+        self._results_lock = threading.Lock()
+
+    def _lookup(self, value):
+        if value != value:
+            # NaN is not equal to anything
+            return frozenset()
+        return frozenset(self.by_value.get(value, ()))
+
+    def search(self, op_name, value):
+        if op_name not in VALUE_OPS:
+            raise ValueError('Unsupported value operator {}'.format(op_name))
+        try:
+            cache_key = op_name, type(value), value
+            return self._results[cache_key]
+        except TypeError:
+            cache_key = None
+        except KeyError:
+            pass
+
+        result = None
+        if op_name in ('eq', 'ne'):
+            if self.hashable and cache_key is not None:
+                result = self._lookup(value)
+                if op_name == 'ne':
+                    result = self.facts - result
+        elif op_name in ('in_', 'nin'):
+            if self.hashable and isinstance(value, _CONTAINER_TYPES):
+                try:
+                    result = frozenset().union(*(self._lookup(v) for v in value))
+                except TypeError:
+                    result = None
+                if result is not None and op_name == 'nin':
+                    result = self.facts - result
+        elif self.sortable and _is_number(value):
+            if op_name == 'gt':
+                result = frozenset(self.sorted_facts[bisect.bisect_right(self.keys, value):])
+            elif op_name == 'ge':
+                result = frozenset(self.sorted_facts[bisect.bisect_left(self.keys, value):])
+            elif op_name == 'lt':
+                result = frozenset(self.sorted_facts[:bisect.bisect_left(self.keys, value)])
+            else:
+                result = frozenset(self.sorted_facts[:bisect.bisect_right(self.keys, value)])
+
+        if result is not None and cache_key is not None:
+            with self._results_lock:
+                if len(self._results) >= _MAX_CACHED_SEARCHES:
+                    self._results.clear()
+                self._results[cache_key] = result
+        return result
@@ -0,0 +1,163 @@
+"""Process pool for querying many filings, with preloaded state shared by its workers.
+
+Before forking its workers, a WorkerPool imports rlq and Arelle and reads the given
+taxonomies of a rlq.taxonomy.TaxonomyCatalog in the parent process, then moves all
+the objects created so far out of reach of the garbage collector (gc.freeze()). The
+workers share those pages with the parent copy-on-write: nothing has to be imported or
+read again in each worker, and since the collector never touches the frozen objects
+(which would write to their headers) the pages stay shared.
+
+Workers are replaced after max_filings_per_worker filings so that memory that Arelle
+does not give back does not pile up. Replacements are forked from the same parent and
+start warm too.
+
+    with WorkerPool(processes=16, catalog=TaxonomyCatalog('taxonomies.sqlite')) as pool:
+        for file_path, rows in pool.query_files(file_paths, query_spec):
+            ...
+
+Only available where processes can be forked, i.e. not on Windows.
+"""
+import functools
+import gc
+import importlib
+import multiprocessing
+import threading
+
+from rlq import serialize
+
+# Modules imported in the parent process before forking
+PRELOAD_MODULES = ('rlq.executor', 'rlq.evaluators.rl', 'rlq.rl_utils', 'rlq.serialize', 'rlq.taxonomy',
+                   'rlq.utils', 'arelle.Cntlr', 'arelle.ModelManager', 'arelle.PackageManager',
+                   'arelle.ValidateXbrlCalcs', 'arelle.ValidateXbrlDimensions')
+
+# Set in each worker by _init_worker()
+_catalog = None
+_taxonomy_version = ''
+
+# gc.freeze() and gc.unfreeze() apply to the whole process, so the objects are only
+# unfrozen once all the pools that froze them are closed, and only if nothing was frozen
+# before the first of them
+_freeze_lock = threading.Lock()
+_freezing_pools = 0
+_frozen_before = False
+
+
+def _freeze():
+    global _freezing_pools, _frozen_before
+    with _freeze_lock:
+        if not _freezing_pools:
+            _frozen_before = gc.get_freeze_count() > 0
+        gc.freeze()
+        _freezing_pools += 1
+
+
+def _release_freeze():
+    global _freezing_pools
+    with _freeze_lock:
+        _freezing_pools -= 1
+        if not _freezing_pools and not _frozen_before:
+            gc.unfreeze()
+
+
+def _init_worker(catalog, taxonomy_version):
+    global _catalog, _taxonomy_version
+    _catalog = catalog
+    _taxonomy_version = taxonomy_version
+
+
+def _query_file(file_path, query_spec_str, timeout=None):
+    # Runs in a worker. The query spec is passed as a string and parsed (and cached)
+    # there, like in rlq.aio.
+    from rlq.cancel import Deadline
+    from rlq.utils import get_query_executor
+    deadline = Deadline.after(timeout) if timeout is not None else None
+    executor = get_query_executor(file_path, catalog=_catalog, taxonomy_version=_taxonomy_version)
+    try:
+        return file_path, executor.query(serialize.loads(query_spec_str), deadline=deadline)
+    finally:
+        executor.evaluator.close()
+
+
+class WorkerPool(object):
+    """Pool of forked worker processes that load and query filings.
+
+    catalog is an optional rlq.taxonomy.TaxonomyCatalog that the workers read taxonomies
+    from, under taxonomy_version (see get_query_executor()), and taxonomies the (entry
+    point, version) keys of those to read before forking, all of the catalog's by default.
+    Taxonomies that are not preloaded are read by each worker that needs them. Extra
+    module names in preload are imported before forking.
+    """
+
+    def __init__(self, processes=None, catalog=None, taxonomies=None, preload=(), max_filings_per_worker=100,
+                 freeze=True, taxonomy_version=''):
+        if max_filings_per_worker is not None and max_filings_per_worker < 1:
+            raise ValueError('max_filings_per_worker must be at least 1')
+        context = multiprocessing.get_context('fork')
+        gc_enabled = gc.isenabled()
+        # Objects that are created while preloading and freed right away would leave holes
+        # in the frozen pages, so collection is held off until everything is loaded
+        gc.disable()
+        try:
+            for module_name in PRELOAD_MODULES + tuple(preload):
+                importlib.import_module(module_name)
+            if catalog is not None:
+                for entry_point, version in (catalog.keys() if taxonomies is None else taxonomies):
+                    catalog.get(entry_point, version)
+            if freeze:
+                _freeze()
+        finally:
+            if gc_enabled:
+                gc.enable()
+        self.catalog = catalog
+        self.frozen = freeze
+        # The workers are forked, so the catalog passed to their initializer is the
+        # parent's preloaded one rather than a pickled copy
+        self._pool = context.Pool(processes, initializer=_init_worker, initargs=(catalog, taxonomy_version),
+                                  maxtasksperchild=max_filings_per_worker)
+
+    def query_files(self, file_paths, query_spec, ordered=True, timeout=None):
+        """Iterate over (file_path, query results) pairs of the filings, queried in the workers.
+
+        With ordered=False the pairs come in the order the filings finish instead of the
+        order of file_paths. An error raised while loading or querying a filing is raised
+        here when its result is reached; calling next() again moves on to the next filing.
+
+        timeout is the number of seconds each filing may take to load and query, counted
+        from when a worker picks it up. It is only checked while querying, since loading
+        cannot be interrupted: a filing that is still loading when it runs out finishes
+        loading and then raises QueryTimeout, and one that runs out while querying raises
+        it shortly after.
+
+        Each filing is a separate task of the underlying Pool, so that workers are recycled
+        after max_filings_per_worker filings.
+        """
+        query_spec_str = serialize.dumps(query_spec)
+        imap = self._pool.imap if ordered else self._pool.imap_unordered
+        return imap(functools.partial(_query_file, query_spec_str=query_spec_str, timeout=timeout), file_paths)
+
+    def close(self):
+        """Wait for the submitted filings to finish and stop the workers."""
+        self._pool.close()
+        self._pool.join()
+        self._unfreeze()
+
+    def terminate(self):
+        """Stop the workers without waiting for the submitted filings."""
+        self._pool.terminate()
+        self._pool.join()
+        self._unfreeze()
+
+    def _unfreeze(self):
+        if self.frozen:
+            _release_freeze()
+            self.frozen = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
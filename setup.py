@@ -19,6 +19,7 @@ setuptools.setup(
     url='https://github.com/parthjoshi2007/rlq',
     # dependency_links=['git+https://github.com/Arelle/Arelle.git#egg=Arelle-1.0.0'],
     install_requires=['arelle'],
+    extras_require={'numpy': ['numpy']},
     classifiers=[
         'Development Status :: 3 - Alpha',
         'License :: OSI Approved :: GNU General Public License v3 (GPLv3)',
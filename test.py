@@ -67,6 +67,35 @@ sample_qspecs = [
                     ['ind-as:KeyManagementPersonnelOfEntityOrParentMember', 'ind-as:OtherRelatedPartiesMember'])]
     },
 
+    # Get the 10 related parties with the largest loans given in the current year.
+    # order_by takes expressions wrapped in Asc/Desc (plain expressions sort ascending).
+    # With a limit only the top rows are kept while the query is evaluated.
+    {
+        'select': [C('ind-as:NameOfRelatedParty'), C('ind-as:LoansGivenRelatedPartyTransactions')],
+        'where': [Ax() >= {'ind-as:CategoriesOfRelatedPartiesAxis'}, FY() == FY.CURR],
+        'order_by': [Desc(C('ind-as:LoansGivenRelatedPartyTransactions'))],
+        'limit': 10
+    },
+
+    # Revenue for all years along with the previous year's revenue and the year-over-year change in %.
+    # Lag, Lead, Change and PctChange look up the value in the previous (or next) FY present in the results.
+    # Use partition=... to compute them separately for each member of a dimension.
+    {
+        'select': [FY(), C('ind-as:RevenueFromOperations'), Lag(C('ind-as:RevenueFromOperations'), by=FY()),
+                   PctChange(C('ind-as:RevenueFromOperations'), by=FY())],
+        'order_by': [Desc(FY())]
+    },
+
+    # Paid up value of each class of equity share capital with one column per FY.
+    # The select expressions identify the rows, pivot gives the columns and pivot_values the cell values.
+    # Pass 'pivot_columns': [...] to fix the columns instead of discovering them from the data.
+    {
+        'select': [DL('ind-as:ClassesOfEquityShareCapitalAxis')],
+        'where': [Ax() >= {'ind-as:ClassesOfEquityShareCapitalAxis'}],
+        'pivot': FY(),
+        'pivot_values': [Sum(C('ind-as:ValueOfSharesSubscribedAndFullyPaid'))]
+    },
+
     # Paid up preference capital for current year
     #
     # Sum the value of the field ind-as:ValueOfSharesSubscribedAndFullyPaid
@@ -84,6 +113,24 @@ sample_qspecs = [
         'output_format': 'row_wise'
     },
 
+    # The same for all years, joining the duration and instant facts instead of changing context_groupby.
+    # Each side of the join selects its own concepts (with its own where and context_groupby clauses) and
+    # the fact sets of the two sides whose on expressions are equal are merged. Pass (left, right) pairs
+    # in on to use different expressions for each side, and 'how': 'left' to keep the left fact sets
+    # that have no match.
+    {
+        'select': [FY(), Sum(C('ind-as:ValueOfSharesSubscribedAndFullyPaid'))],
+        'join': {
+            'left': {'concepts': ['ind-as:TypeOfShare'],
+                     'where': [Ax() >= {'ind-as:ClassesOfEquityShareCapitalAxis'}]},
+            'right': {'concepts': ['ind-as:ValueOfSharesSubscribedAndFullyPaid'],
+                      'where': [Ax() >= {'ind-as:ClassesOfEquityShareCapitalAxis'}]},
+            'on': [CtxHash()]
+        },
+        'where': [C('ind-as:TypeOfShare').icontains('preference')],
+        'groupby': [FY()]
+    },
+
     # Get the paid up preference capital for all years
     {
         'select': [Sum(C('ind-as:ValueOfSharesSubscribedAndFullyPaid')), FY()],
@@ -91,6 +138,18 @@ sample_qspecs = [
                   C('ind-as:TypeOfShare').icontains('preference')],
         'context_groupby': [CtxHash()],
         'groupby': [FY()]  # Group by FY for the sum aggregation
+    },
+
+    # Paid up capital by FY and class of shares, with a subtotal per FY and a grand total.
+    # rollup: [a, b] groups by (a, b), (a) and () in a single pass over the fact sets; use
+    # grouping_sets: [[a, b], [b], []] to choose the groupings. The grouping_set column added to
+    # the output gives the index of the grouping of each row, and the expressions a row is not
+    # grouped by are None.
+    {
+        'select': [FY(), DL('ind-as:ClassesOfEquityShareCapitalAxis'),
+                   Sum(C('ind-as:ValueOfSharesSubscribedAndFullyPaid'))],
+        'where': [Ax() >= {'ind-as:ClassesOfEquityShareCapitalAxis'}],
+        'rollup': [FY(), DL('ind-as:ClassesOfEquityShareCapitalAxis')]
     }
 ]
 
@@ -0,0 +1,51 @@
+import unittest
+
+from rlq.expr import properties as p
+from rlq.expr.aggregate import Avg, Count, First, Join, Last, Max, Min, Sum
+from rlq.materialized import _merge_partials
+
+
+class MergedStateTest(unittest.TestCase):
+    FIXED_SIZE = (First, Last, Min, Max, Sum, Avg, Count)
+
+    def merge_filings(self, aggregates, filings):
+        # Merge the partial states of one group filing by filing, like MaterializedQuery.add_filing()
+        merged, sizes = None, []
+        for values in filings:
+            partial = [None], [a.partial(values) for a in aggregates]
+            merged = partial if merged is None else _merge_partials(aggregates, [merged, partial])
+            sizes.append([_size(state) for state in merged[1]])
+        return merged[1], sizes
+
+    def test_state_size_is_constant(self):
+        aggregates = [cls(p.ConceptValue('A')) for cls in self.FIXED_SIZE]
+        filings = [[1, 2, 3]] + [[] if i % 7 == 0 else [1, 2, 3] for i in range(1, 50)]
+        _, sizes = self.merge_filings(aggregates, filings)
+        self.assertEqual(sizes, [[1, 1, 1, 1, 1, 2, 1]] * len(filings))
+
+    def test_merged_state_finalizes_to_aggregate(self):
+        aggregates = [cls(p.ConceptValue('A')) for cls in self.FIXED_SIZE + (Join,)]
+        filings = [[5, 2], [], [9], [1, 7, 3], []]
+        states, _ = self.merge_filings(aggregates, filings)
+        values = [v for filing in filings for v in filing]
+        for aggregate, state in zip(aggregates[:-1], states):
+            self.assertEqual(aggregate.finalize(state), aggregate.aggregate(values), type(aggregate).__name__)
+        join_filings = [[str(v) for v in filing] for filing in filings]
+        states, _ = self.merge_filings(aggregates[-1:], join_filings)
+        self.assertEqual(aggregates[-1].finalize(states[0]), '5, 2, 9, 1, 7, 3')
+
+    def test_empty_states(self):
+        aggregates = [cls(p.ConceptValue('A'), empty='-') for cls in self.FIXED_SIZE]
+        states, _ = self.merge_filings(aggregates, [[], []])
+        self.assertEqual([a.finalize(s) for a, s in zip(aggregates, states)], ['-'] * len(aggregates))
+
+
+def _size(state):
+    # Number of values held in a state
+    if isinstance(state, tuple):
+        return sum(_size(s) for s in state)
+    return len(state) if isinstance(state, list) else 1
+
+
+if __name__ == '__main__':
+    unittest.main()